@@ -1,7 +1,203 @@
-from flask import Flask, render_template, jsonify, request
+import base64
+import csv
+import functools
+import gzip
+import io
+import json
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import Flask, render_template, jsonify, request, g, make_response
 from database import *
+from response_cache import VersionedCache
+from facet_index import FacetIndex, FACETS
+from json_provider import JSONProvider, orjson
+from suggest_index import SuggestIndex
+from instrumentation import METRICS_ENABLED, TimedConnection, init_app as init_instrumentation, render_metrics, \
+    timed_phase
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = 1024
+# gzip compression level, 6 balances size and CPU like most web servers
+GZIP_LEVEL = 6
+# brotli quality, 5 compresses better than gzip at a similar speed
+BROTLI_QUALITY = 5
+# Content encodings in order of preference, brotli only when the optional package is installed
+CONTENT_ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+# Mimetypes worth compressing
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/html', 'text/csv'}
+# Clients may store responses but must revalidate them, a 304 makes the revalidation cheap
+CACHE_CONTROL = 'no-cache'
+# API endpoints whose responses do not derive from the catalogue data and must never be reused
+UNCACHEABLE_ENDPOINTS = {'get_pool_stats', 'get_metrics'}
+# Version of the format of API responses, bump it when their bodies change for the same catalogue data
+RESPONSE_FORMAT_VERSION = 1
+# Start of the catalogue ETags: API bodies also change with the response format and the JSON encoder (orjson writes
+# UTF-8 where the json module escapes), so a deploy changing either does not revalidate the old bodies
+ETAG_PREFIX = f'f{RESPONSE_FORMAT_VERSION}-{"orjson" if orjson else "json"}'
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
+if METRICS_ENABLED:
+    # Registered before every other request hook, so the timings cover them
+    init_instrumentation(app)
+db_pool = ConnectionPool(factory=TimedConnection) if METRICS_ENABLED else ConnectionPool()
+response_cache = VersionedCache(lambda: get_catalogue_version(get_db().cursor()))
+
+
+def get_db():
+    """Get the pooled connection of the current app context, acquiring one on first use"""
+    if 'db' not in g:
+        with timed_phase('db_acquire'):
+            g.db = db_pool.acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exception):
+    """Return the app context's connection to the pool, also when the request failed"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+
+class CatalogueIndex:
+    """
+    In-memory index of the catalogue, built with build(cursor, version) on first use and again once the catalogue
+    version has changed; concurrent requests wait for a single build under the lock
+    """
+
+    def __init__(self, build, lock: threading.Lock):
+        self.build = build
+        self.lock = lock
+        self.index = None
+
+    def get(self):
+        version = response_cache.version()
+        index = self.index
+        if index is None or index.version != version:
+            with self.lock:
+                if self.index is None or self.index.version != version:
+                    self.index = self.build(get_db().cursor(), version)
+                index = self.index
+        return index
+
+
+# Faceted search index of /api/search and typeahead index of /api/suggest
+facet_index = CatalogueIndex(FacetIndex.build, threading.Lock())
+suggest_index = CatalogueIndex(SuggestIndex.build, threading.Lock())
+
+
+def cached_json(view):
+    """Serve a JSON endpoint's successful responses from response_cache until the catalogue changes"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.full_path
+        g.cache_key = key
+        body = response_cache.get(key)
+        if body is not None:
+            return app.response_class(body, mimetype='application/json')
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response_cache.set(key, response.get_data())
+        return response
+    return wrapper
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encoded_etag(etag: str, encoding: str | None) -> str:
+    """Strong ETags must differ per content encoding, so compressed representations get a suffix"""
+    return f'{etag}-{encoding}' if encoding else etag
+
+
+def matching_etag(etag: str) -> str | None:
+    """
+    The ETag of the representation of the response named in If-None-Match, if any
+    Only the representations this request may be served count: the plain one (small bodies are not compressed) and
+    the one in the client's preferred encoding, a client that no longer accepts it must get the body again
+    """
+    for encoding in (None, request.accept_encodings.best_match(CONTENT_ENCODINGS)):
+        if request.if_none_match.contains(encoded_etag(etag, encoding)):
+            return encoded_etag(etag, encoding)
+    return None
+
+
+def not_modified(etag: str):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.before_request
+def check_catalogue_etag():
+    """
+    Answer conditional GETs of API endpoints with a 304 before running the view
+    Their responses only change with the catalogue and the response format, so the ETag is derived from the
+    catalogue version and ETAG_PREFIX
+    """
+    if request.method not in ('GET', 'HEAD') or not request.path.startswith('/api/') \
+            or request.endpoint in UNCACHEABLE_ENDPOINTS:
+        return None
+    g.etag = f'{ETAG_PREFIX}-v{response_cache.version()}'
+    if cached_etag := matching_etag(g.etag):
+        return not_modified(cached_etag)
+    return None
+
+
+@app.after_request
+def add_cache_headers(response):
+    """
+    Add ETag and Cache-Control headers and compress the body with the client's preferred encoding
+    Pages get an ETag hashed from their body, API responses the catalogue ETag; streamed bodies are sent as is
+    """
+    if request.endpoint in UNCACHEABLE_ENDPOINTS:
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+        return response
+    if response.is_streamed:
+        if 'etag' in g:
+            response.set_etag(g.etag)
+            response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    etag = g.get('etag')
+    if etag is None:
+        response.add_etag()
+        etag = response.get_etag()[0]
+    encoding = None
+    if response.mimetype in COMPRESSIBLE_MIMETYPES and response.content_length >= COMPRESS_MIN_SIZE:
+        encoding = request.accept_encodings.best_match(CONTENT_ENCODINGS)
+    if request.if_none_match.contains(encoded_etag(etag, encoding)):
+        return not_modified(encoded_etag(etag, encoding))
+
+    if encoding:
+        # Compressed bodies of cached endpoints are cached as well, a repeated request compresses nothing
+        cache_key = (g.cache_key, encoding) if 'cache_key' in g else None
+        body = response_cache.get(cache_key) if cache_key else None
+        if body is None:
+            with timed_phase('compress'):
+                body = compress_body(response.get_data(), encoding)
+            if cache_key:
+                response_cache.set(cache_key, body)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(encoded_etag(etag, encoding))
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/')
@@ -17,102 +213,330 @@ def composer_detail():
 
 
 @app.route('/api/genres')
+@cached_json
 def get_genres():
     """Get all unique music work genres from the database, sorted alphabetically"""
     try:
-        all_works = get_all_works()
-        genres = []
-        for work in all_works:
-            genres.extend(work.genre.split(','))
-        # Deduplicate and sort genres
-        genres = sorted(list(set(genres)))
-        return jsonify(genres)
+        return jsonify(get_all_genres(get_db().cursor()))
     except Exception as e:
         return jsonify({'error': f'Server error when fetching genres: {str(e)}'}), 500
 
 
 @app.route('/api/decades')
+@cached_json
 def get_decades():
     """Get all unique creation decades of works from the database, sorted numerically"""
     try:
-        all_works = get_all_works()
-        decades = []
-        for work in all_works:
-            decades.append(work.decade)
-        # Deduplicate and sort decades
-        decades = sorted(list(set(decades)))
-        return jsonify(decades)
+        return jsonify(get_all_decades(get_db().cursor()))
     except Exception as e:
         return jsonify({'error': f'Server error when fetching decades: {str(e)}'}), 500
 
 
+# Sort keys of /api/works: (SQL expression, row column) pairs compared by keyset pagination
+# work_id is appended to every key so that the order is total
+WORK_SORT_KEYS = {
+    'title': [('w.title', 'title')],
+    'year': [('w.creation_year', 'creation_year')],
+    'composer': [('c.name', 'composer'), ('w.title', 'title')],
+    'relevance': [('s.rank', 'search_rank')],
+}
+# Largest page size accepted by /api/works
+MAX_PAGE_SIZE = 1000
+
+
+def works_filter_query(args):
+    """
+    Build the FROM/WHERE part of a works query from the keyword/type/decade filters of a request
+    Return the SQL text, its parameters and whether the keyword search subquery (alias s) is joined
+    """
+    # Get request parameters (default values set for non-required fields)
+    keyword = args.get('keyword', '').lower()
+    type_filter = args.get('type', 'all')  # all = no genre filter
+    decade_filter = args.get('decade', 'all')  # all = no decade filter
+    # Base query with join between works and composers table
+    query = '''
+            FROM works w
+            JOIN composers c ON w.composer_id = c.composer_id
+        '''
+    params = []
+    # Full-text search by work title or composer name, ranked by relevance
+    if keyword:
+        search_query, search_params = keyword_search_query(keyword)
+        query += f' JOIN ({search_query}) s ON s.work_id = w.work_id'
+        params.extend(search_params)
+    query += ' WHERE 1=1'
+    # Exact filter by one of the work's genres (if not 'all')
+    if type_filter != 'all':
+        query += '''
+                AND w.work_id IN (
+                    SELECT wg.work_id
+                    FROM work_genres wg
+                    JOIN genres g ON wg.genre_id = g.genre_id
+                    WHERE g.name = ?
+                )
+            '''
+        params.append(type_filter)
+    # Exact filter by creation decade (if not 'all')
+    if decade_filter != 'all':
+        query += ' AND w.decade = ?'
+        params.append(decade_filter)
+    return query, params, bool(keyword)
+
+
+def encode_cursor(sort, order, values):
+    """Encode the sort key of the last returned work as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps([sort, order, *values]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort, order):
+    """Decode a pagination cursor, raise ValueError if it is malformed or was made for another sort order"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Malformed cursor')
+    if not isinstance(values, list) or values[:2] != [sort, order] or len(values) != len(WORK_SORT_KEYS[sort]) + 3:
+        raise ValueError('Cursor does not match the requested sort order')
+    return values[2:]
+
+
+def parse_sort_args(args):
+    """
+    Read the sort and order parameters of a works request, raise ValueError if they are not supported
+    sort defaults to relevance for keyword searches and to None (database order) otherwise
+    """
+    has_keyword = bool(args.get('keyword', ''))
+    sort = args.get('sort', 'relevance' if has_keyword else None)
+    order = args.get('order', 'asc')
+    if sort is not None and sort not in WORK_SORT_KEYS or sort == 'relevance' and not has_keyword:
+        raise ValueError(f'Unsupported sort: {sort}')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'Unsupported order: {order}')
+    return sort, order
+
+
+def sort_keys(sort):
+    """(SQL expression, row column) pairs of a sort, with work_id appended so that the order is total"""
+    return WORK_SORT_KEYS[sort] + [('w.work_id', 'work_id')]
+
+
+def order_by_clause(sort, order):
+    direction = 'DESC' if order == 'desc' else 'ASC'
+    return ' ORDER BY ' + ', '.join(f'{column} {direction}' for column, _ in sort_keys(sort))
+
+
 @app.route('/api/works')
 def get_works():
     """
     Get filtered music works by keyword/genre/decade
-    Support fuzzy search for title/composer, exact match for decade, fuzzy match for genre
+    Support full-text search for title/composer (ranked by relevance), exact match for decade and genre
+    Optional sort (title/year/composer/relevance) and order (asc/desc) sort on the server
+    With limit, return one page {works, next_cursor} and pass next_cursor as cursor to get the next one;
+    total=1 adds the number of matching works. Without limit, return every matching work as a list
     """
-    # Get request parameters (default values set for non-required fields)
-    keyword = request.args.get('keyword', '').lower()
-    type_filter = request.args.get('type', 'all')  # all = no genre filter
-    decade_filter = request.args.get('decade', 'all')  # all = no decade filter
+    page_cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Base query with join between works and composers table
-        query = '''
-                SELECT w.*, c.name as composer 
-                FROM works w
-                JOIN composers c ON w.composer_id = c.composer_id
-                WHERE 1=1
-            '''
-        params = []
-        # Fuzzy search by work title or composer name
-        if keyword:
-            query += '''
-                    AND (w.title LIKE ? OR c.name LIKE ?)
-                '''
-            params.extend([f'%{keyword}%', f'%{keyword}%'])
-        # Fuzzy filter by work genre (if not 'all')
-        if type_filter != 'all':
-            query += ' AND w.genre like ?'
-            params.append(f'%{type_filter}%')
-        # Exact filter by creation decade (if not 'all')
-        if decade_filter != 'all':
-            query += ' AND w.decade = ?'
-            params.append(decade_filter)
+        sort, order = parse_sort_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+        limit = int(limit)
+        sort = sort or 'title'
+    try:
+        cursor = get_db().cursor()
+        filter_query, params, has_search = works_filter_query(request.args)
+        if limit is None:
+            # The full list is encoded by SQLite row by row, no Work or dict is built for it
+            query = f'SELECT {WORK_JSON_OBJECT}'
+        else:
+            query = 'SELECT w.*, c.name as composer'
+            if has_search:
+                query += ', s.rank as search_rank'
+        query += filter_query
+        if sort:
+            keys = sort_keys(sort)
+            # Keyset pagination: continue right after the last work of the previous page
+            if page_cursor:
+                try:
+                    after = decode_cursor(page_cursor, sort, order)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                columns = ', '.join(column for column, _ in keys)
+                query += f' AND ({columns}) {"<" if order == "desc" else ">"} ({", ".join("?" * len(keys))})'
+                params = params + after
+            query += order_by_clause(sort, order)
+        if limit is not None:
+            # One extra row tells whether there is a next page
+            query += f' LIMIT {limit + 1}'
         cursor.execute(query, params)
+        if limit is None:
+            return app.response_class(json_array_of_rows(cursor), mimetype='application/json')
         rows = cursor.fetchall()
-        conn.close()
-        works = []
-        # Format rows to Work object list and convert to dict
-        for row in rows:
-            work = Work(
-                work_id=row['work_id'],
-                composer_id=row['composer_id'],
-                title=row['title'],
-                genre=row['genre'],
-                creation_year=row['creation_year'],
-                detail_url=row['detail_url'],
-                composer=row['composer'],
-                decade=row['decade']
-            )
-            works.append(work.to_dict())
-        return jsonify(works)
+        # A page is small, its dicts are built straight from the rows without filling a WorkStore first
+        works = [{field: row[field] for field in WorkStore.FIELDS} for row in rows[:limit]]
+
+        page = {'works': works, 'next_cursor': None}
+        if len(rows) > limit:
+            last_row = rows[limit - 1]
+            page['next_cursor'] = encode_cursor(sort, order, [last_row[name] for _, name in keys])
+        if request.args.get('total') in ('1', 'true'):
+            count_query, count_params, _ = works_filter_query(request.args)
+            cursor.execute('SELECT COUNT(*)' + count_query, count_params)
+            page['total'] = cursor.fetchone()[0]
+        return jsonify(page)
     except Exception as e:
         return jsonify({'error': f'Server error when fetching filtered works: {str(e)}'}), 500
 
 
+# Columns of exported works: (header in CSV files, key in JSONL records, row column)
+EXPORT_COLUMNS = [
+    ('Work ID', 'work_id', 'work_id'),
+    ('Composer', 'composer', 'composer'),
+    ('Title', 'title', 'title'),
+    ('Genre', 'genre', 'genre'),
+    ('Creation Year', 'creation_year', 'creation_year'),
+    ('Detail URL', 'detail_url', 'detail_url'),
+    ('Decade', 'decade', 'decade'),
+]
+# Number of rows fetched from SQLite and written out per chunk of an export
+EXPORT_BATCH_SIZE = 500
+
+
+def export_csv_chunks(rows_batches):
+    """Format batches of rows as CSV text chunks, starting with a UTF-8 BOM and the header row for Excel"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    buffer.write('\ufeff')
+    writer.writerow([header for header, _, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue()
+    for rows in rows_batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([row[column] for _, _, column in EXPORT_COLUMNS] for row in rows)
+        yield buffer.getvalue()
+
+
+def export_jsonl_chunks(rows_batches):
+    """Format batches of rows as JSON Lines text chunks, one work object per line"""
+    for rows in rows_batches:
+        yield ''.join(
+            json.dumps({key: row[column] for _, key, column in EXPORT_COLUMNS}, ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+
+EXPORT_FORMATS = {
+    'csv': (export_csv_chunks, 'text/csv'),
+    'jsonl': (export_jsonl_chunks, 'application/x-ndjson'),
+}
+
+
+@app.route('/api/works/export')
+def export_works():
+    """
+    Export every work matching the /api/works filters (keyword/type/decade, sort/order) as CSV or JSONL
+    The file is streamed from a database cursor in batches, so server memory does not grow with the catalogue
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported export format: {export_format}'}), 400
+    try:
+        sort, order = parse_sort_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filter_query, params, _ = works_filter_query(request.args)
+    query = 'SELECT w.*, c.name as composer' + filter_query + order_by_clause(sort or 'title', order)
+
+    def rows_batches():
+        # The streamed body outlives the request's app context and lasts as long as the client's download, so it
+        # reads through a connection of its own: slow downloads must not use up the pool of the other requests
+        conn = db_pool.open_connection()
+        try:
+            cursor = conn.execute(query, params)
+            while rows := cursor.fetchmany(EXPORT_BATCH_SIZE):
+                yield rows
+        finally:
+            conn.close()
+
+    format_chunks, mimetype = EXPORT_FORMATS[export_format]
+    filename = f'WorkList_{time.strftime("%Y-%m-%d-%H-%M-%S")}.{export_format}'
+    return app.response_class(
+        format_chunks(rows_batches()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+def get_facet_index() -> FacetIndex:
+    """The facet index of the current catalogue version, built again once the catalogue has changed"""
+    return facet_index.get()
+
+
+@app.route('/api/search')
+@cached_json
+def search_works():
+    """
+    Faceted search: works matching keyword and the type/decade/composer filters, sorted by title,
+    with the number of works of every genre, decade and composer under the current filters
+    Each facet parameter may be repeated to match any of its values; limit (default 100, 0 = counts only) and offset page
+    """
+    limit = request.args.get('limit', '100')
+    offset = request.args.get('offset', '0')
+    if not limit.isdigit() or int(limit) > MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 0 and {MAX_PAGE_SIZE}'}), 400
+    if not offset.isdigit():
+        return jsonify({'error': 'offset must be a non-negative integer'}), 400
+    try:
+        index = get_facet_index()
+        filters = {facet: [value for value in request.args.getlist(facet) if value != 'all'] for facet in FACETS}
+        within = None
+        keyword = request.args.get('keyword', '').lower()
+        if keyword:
+            search_query, search_params = keyword_search_query(keyword)
+            cursor = get_db().execute(f'SELECT work_id FROM ({search_query})', search_params)
+            within = index.bitset_of_ids(row[0] for row in cursor.fetchall())
+        return jsonify(index.search(filters, within, int(offset), int(limit)))
+    except Exception as e:
+        return jsonify({'error': f'Server error when searching works: {str(e)}'}), 500
+
+
+# Number of suggestions returned by /api/suggest by default and at most
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+
+def get_suggest_index() -> SuggestIndex:
+    """The typeahead index of the current catalogue version, built again once the catalogue has changed"""
+    return suggest_index.get()
+
+
+@app.route('/api/suggest')
+def suggest():
+    """
+    Typeahead: work titles and composer names starting with q, or with q from one of their later words on,
+    ignoring case and accents; limit (default 10, at most 50) caps the number of suggestions
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', str(SUGGEST_LIMIT))
+    if not limit.isdigit() or not 1 <= int(limit) <= MAX_SUGGEST_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {MAX_SUGGEST_LIMIT}'}), 400
+    try:
+        return jsonify({'query': query, 'suggestions': get_suggest_index().suggest(query, int(limit))})
+    except Exception as e:
+        return jsonify({'error': f'Server error when fetching suggestions: {str(e)}'}), 500
+
+
 @app.route('/api/composers')
+@cached_json
 def get_composers():
     """Get all composers (ID + name) from database, sorted by name alphabetically"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = get_db().cursor()
         # Query composer ID and name, sorted by name
         cursor.execute('SELECT composer_id, name FROM composers ORDER BY name ASC')
         composers = cursor.fetchall()
-        conn.close()
 
         # Format to front-end compatible list
         composer_list = []
@@ -126,85 +550,65 @@ def get_composers():
         return jsonify({'error': f'Server error when fetching composer list: {str(e)}'}), 500
 
 
-def row_to_dict(row):
-    """Convert a single sqlite3.Row object to a standard Python dictionary"""
-    if not row:
-        return None
-    return dict(row)
+@app.route('/api/pool-stats')
+def get_pool_stats():
+    """Get usage statistics of the database connection pool and the response cache"""
+    return jsonify({**db_pool.stats(), 'cache': response_cache.stats()})
 
 
-def rows_to_list(rows):
-    """Convert a list of sqlite3.Row objects to a list of standard Python dictionaries"""
-    if not rows:
-        return []
-    return [dict(row) for row in rows]
+@app.route('/metrics')
+def get_metrics():
+    """Latency histograms of requests, their phases and SQL statements of this worker in the Prometheus text format"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled (METRICS_ENABLED=0)'}), 404
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/composers/stats')
+@cached_json
+def get_all_composer_stats():
+    """Get the detail summary of every composer (same fields as /api/composers/<id>), sorted by name"""
+    try:
+        return jsonify(get_composer_stats(get_db().cursor()))
+    except Exception as e:
+        return jsonify({'error': f'Server error when fetching composer statistics: {str(e)}'}), 500
 
 
 @app.route('/api/composers/<int:composer_id>')
+@cached_json
 def get_composer_detail(composer_id):
     """
     Get detailed information of a specific composer by ID
-    Include basic info, top 5 works, genre statistics, work count distribution by decade
+    Include basic info, work count, top 5 works, genre statistics, work count distribution by decade
+    All of it is precomputed at import time, so this is a single primary key lookup
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # 1. Query basic composer info (ID + name)
-        cursor.execute('''
-            SELECT c.composer_id, c.name
-            FROM composers c
-            WHERE c.composer_id = ?
-        ''', (composer_id,))
-        composer = cursor.fetchone()
-        if not composer:
-            conn.close()
+        composer_stats = get_composer_stats(get_db().cursor(), composer_id)
+        if not composer_stats:
             return jsonify({'error': f'Composer with ID {composer_id} not found'}), 404
-
-        # 2. Query top 5 representative works (sorted by creation year)
-        cursor.execute('''
-            SELECT title, creation_year as create_year
-            FROM works
-            WHERE composer_id = ?
-            ORDER BY creation_year ASC
-            LIMIT 5
-        ''', (composer_id,))
-        represent_works = rows_to_list(cursor.fetchall())
-        # 3. Query work genre statistics (group by genre, count works)
-        cursor.execute('''
-            SELECT genre, COUNT(*) as count
-            FROM works
-            WHERE composer_id = ?
-            GROUP BY genre
-        ''', (composer_id,))
-
-        genre_stats = rows_to_list(cursor.fetchall())
-        genre_stat_dict = {item['genre']: item['count'] for item in genre_stats}
-        print(4)
-        # 4. Query work count distribution by decade (group by decade, count works)
-        cursor.execute('''
-            SELECT decade, COUNT(*) as count
-            FROM works
-            WHERE composer_id = ?
-            GROUP BY decade
-            ORDER BY decade ASC
-        ''', (composer_id,))
-        year_distributions = rows_to_list(cursor.fetchall())
-        year_dist_dict = {item['decade']: item['count'] for item in year_distributions}
-        conn.close()
-
-        # Assemble final detail data (front-end compatible format)
-        composer_detail = {
-            'id': composer['composer_id'],
-            'name': composer['name'],
-            'represent_works': represent_works,
-            'genre_stat': genre_stat_dict,
-            'year_distribution': year_dist_dict
-        }
-        return jsonify(composer_detail)
+        return jsonify(composer_stats[0])
     except Exception as e:
         return jsonify({'error': f'Server error when fetching composer detail: {str(e)}'}), 500
 
 
+def build_indexes():
+    """Build the facet and typeahead indexes of the current catalogue, so the first search does not wait for them"""
+    with app.app_context():
+        get_facet_index()
+        get_suggest_index()
+
+
+def load_catalogue(workers: int | None = PARSE_WORKERS):
+    """
+    Create or migrate the database, then build the in-memory indexes; the entry points (app.py, serve.py,
+    check_query_plans.py) call it before serving, importing this module does not: creating the database parses the
+    XML files in a process pool, and with the spawn start method (Windows, macOS) every worker imports the main module
+    """
+    init_database(workers)
+    build_indexes()
+
+
 if __name__ == '__main__':
+    load_catalogue()
+    # Development server with the reloader, serve.py runs the app in production
     app.run(debug=True)
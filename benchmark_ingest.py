@@ -0,0 +1,191 @@
+"""
+Ingest benchmark suite: generate synthetic MEI corpora (generate_corpus.py) at several scales and measure
+parse throughput, clean (uncached and from a warm parse cache) and import wall time, peak RSS and the size of the resulting database
+Each scale runs in its own process, so its peak RSS is not inflated by the previous ones
+Results are saved as JSON, pass an earlier result file to --compare to see the change of every metric
+Usage: python benchmark_ingest.py [scale ...] [--workers N] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Numbers of works of the benchmarked corpora (100_000 needs several GB of disk for the corpus)
+BENCHMARK_SCALES = (1_000, 10_000)
+# Where generated corpora are kept, so later runs (e.g. on another commit) measure the very same files
+CORPUS_DIR = 'benchmark-corpus'
+# Where results are written by default, one JSON file per commit
+RESULTS_DIR = 'benchmark-results'
+# Files parsed serially by each parser to measure its throughput
+PARSE_SAMPLE_SIZE = 500
+CORPUS_SEED = 0
+# Metrics where a larger value is better, for --compare
+HIGHER_IS_BETTER = {'parse_full_files_per_s', 'parse_header_files_per_s', 'parse_header_mb_per_s',
+                    'parse_full_mb_per_s', 'clean_files_per_s'}
+
+
+def peak_rss_mb(who) -> float | None:
+    """Peak resident set size of this process (or of its finished children), None where resource is missing"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    divisor = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    return resource.getrusage(who).ru_maxrss / divisor
+
+
+def parse_throughput(parser, xml_paths) -> dict:
+    size = sum(os.path.getsize(xml_path) for xml_path in xml_paths)
+    start = time.perf_counter()
+    accepted = sum(1 for xml_path in xml_paths if parser(xml_path))
+    elapsed = time.perf_counter() - start
+    return {'files_per_s': len(xml_paths) / elapsed, 'mb_per_s': size / 2 ** 20 / elapsed, 'accepted': accepted}
+
+
+def corpus_composers_file(scale: int) -> str:
+    """composers.json of the corpus of the given size, generating the corpus first if it does not exist yet"""
+    from generate_corpus import generate_corpus
+
+    corpus_dir = os.path.join(CORPUS_DIR, f'{scale}-seed{CORPUS_SEED}')
+    composers_file = os.path.join(corpus_dir, 'composers.json')
+    if not os.path.exists(composers_file):
+        print(f'Generating {scale} synthetic works in {corpus_dir}...')
+        generate_corpus(corpus_dir, scale, CORPUS_SEED)
+    return composers_file
+
+
+def run_scale(scale: int, workers: int | None) -> dict:
+    """Benchmark one corpus size (already generated) in the current process"""
+    from data_clean import load_work_entries, clean_entries, parse_mei_xml, parse_mei_header
+    from database import set_bulk_load_pragmas, create_table, import_data, refresh_composer_stats
+
+    composers_file = corpus_composers_file(scale)
+    result = {'scale': scale, 'workers': workers}
+    with open(composers_file, 'r', encoding='utf-8') as f:
+        composers = json.load(f)
+
+    entries, _ = load_work_entries(composers)
+    xml_paths = [xml_path for _, _, xml_path in entries]
+    result['corpus_mb'] = sum(os.path.getsize(xml_path) for xml_path in xml_paths) / 2 ** 20
+    sample = xml_paths[:PARSE_SAMPLE_SIZE]
+    for name, parser in (('full', parse_mei_xml), ('header', parse_mei_header)):
+        throughput = parse_throughput(parser, sample)
+        result[f'parse_{name}_files_per_s'] = throughput['files_per_s']
+        result[f'parse_{name}_mb_per_s'] = throughput['mb_per_s']
+
+    start = time.perf_counter()
+    entries, _ = load_work_entries(composers)
+    works = clean_entries(entries, workers, cache_file=None)
+    result['clean_seconds'] = time.perf_counter() - start
+    result['clean_files_per_s'] = len(entries) / result['clean_seconds']
+    result['works_accepted'] = len(works)
+
+    # A rebuild over the unchanged corpus: the first pass fills a fresh parse cache, the second only reads it
+    cache_file = os.path.join(os.path.dirname(composers_file), 'parse-cache.db')
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    clean_entries(entries, workers, cache_file=cache_file)
+    start = time.perf_counter()
+    clean_entries(entries, workers, cache_file=cache_file)
+    result['clean_cached_seconds'] = time.perf_counter() - start
+
+    database_file = os.path.join(os.path.dirname(composers_file), 'benchmark.db')
+    if os.path.exists(database_file):
+        os.remove(database_file)
+    start = time.perf_counter()
+    conn = sqlite3.connect(database_file)
+    cursor = conn.cursor()
+    set_bulk_load_pragmas(cursor)
+    create_table(cursor)
+    import_data(cursor, works, composers)
+    refresh_composer_stats(cursor)
+    conn.commit()
+    conn.close()
+    result['import_seconds'] = time.perf_counter() - start
+    result['db_mb'] = os.path.getsize(database_file) / 2 ** 20
+    result['peak_rss_mb'] = peak_rss_mb(resource.RUSAGE_SELF) if resource else None
+    result['peak_rss_workers_mb'] = peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(scales, workers: int | None) -> dict:
+    results = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scales': [],
+    }
+    for scale in scales:
+        # Generated here, so the generator does not count towards the peak RSS of the measured process
+        corpus_composers_file(scale)
+        command = [sys.executable, __file__, '--run-scale', str(scale)]
+        if workers:
+            command += ['--workers', str(workers)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        # The scale's result is the last line, anything before it is progress output of the pipeline
+        scale_result = json.loads(output.strip().splitlines()[-1])
+        results['scales'].append(scale_result)
+        print(', '.join(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}'
+                        for key, value in scale_result.items()))
+    return results
+
+
+def compare(previous: dict, current: dict):
+    """Print the relative change of every metric of the scales both runs measured"""
+    previous_scales = {scale_result['scale']: scale_result for scale_result in previous['scales']}
+    print(f"Compared with {previous.get('commit')} ({previous.get('created')}):")
+    for scale_result in current['scales']:
+        before = previous_scales.get(scale_result['scale'])
+        if not before:
+            continue
+        for metric, value in scale_result.items():
+            if not isinstance(value, float) or not before.get(metric):
+                continue
+            change = value / before[metric] - 1
+            better = change > 0 if metric in HIGHER_IS_BETTER else change < 0
+            # Changes within 5% are treated as noise
+            verdict = (', better' if better else ', worse') if abs(change) > 0.05 else ''
+            print(f"  {scale_result['scale']:>7} {metric:<26} {before[metric]:>10.2f} -> {value:>10.2f} "
+                  f"({change:+.1%}{verdict})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark MEI parsing, cleaning and importing on synthetic corpora')
+    parser.add_argument('scales', nargs='*', type=int, default=list(BENCHMARK_SCALES))
+    parser.add_argument('--workers', type=int, default=None, help='parse worker processes (default: one per core)')
+    parser.add_argument('--output', help=f'result file (default: {RESULTS_DIR}/ingest-<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare with')
+    parser.add_argument('--run-scale', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        print(json.dumps(run_scale(args.run_scale, args.workers)))
+        sys.exit(0)
+
+    results = benchmark(args.scales, args.workers)
+    output = args.output or os.path.join(RESULTS_DIR, f"ingest-{(results['commit'] or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to {output}')
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), results)
@@ -0,0 +1,67 @@
+import json
+import sys
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from benchmark_work_store import BENCHMARK_SCALES, WORKS_QUERY, build_catalogue, load_work_objects, load_work_store
+from database import WORK_JSON_OBJECT, json_array_of_rows
+from json_provider import OrjsonProvider, orjson
+
+# Runs of every case, the fastest one is reported
+REPEAT = 3
+
+
+def direct_json(conn) -> bytes:
+    """The /api/works path: SQLite builds every work's JSON object, the rows are only joined"""
+    conn.row_factory = None
+    return json_array_of_rows(conn.execute(WORKS_QUERY.replace('w.*, c.name as composer', WORK_JSON_OBJECT)))
+
+
+def best_time(fn):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        body = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+def benchmark(scales=BENCHMARK_SCALES):
+    """Compare ways of turning the works of the catalogue into the JSON body of /api/works"""
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    cases = {
+        'Work objects -> json': lambda conn: default_provider.response(
+            [work.to_dict() for work in load_work_objects(conn)]).get_data(),
+        'WorkStore -> json': lambda conn: default_provider.response(load_work_store(conn).to_dicts()).get_data(),
+    }
+    if orjson:
+        orjson_provider = OrjsonProvider(app)
+        cases['WorkStore -> orjson'] = lambda conn: orjson_provider.response(load_work_store(conn).to_dicts()).get_data()
+    else:
+        print('orjson is not installed, its case is skipped')
+    cases['SQL json_object rows'] = direct_json
+
+    print(f"{'works':>8} {'path':<24} {'seconds':>8} {'MB':>7} {'speedup':>8}")
+    for scale in scales:
+        conn = build_catalogue(scale)
+        expected = None
+        baseline = None
+        for path, fn in cases.items():
+            seconds, body = best_time(lambda: fn(conn))
+            # Every path must produce the same works, byte differences (escaping, key order) aside
+            works = json.loads(body)
+            if expected is None:
+                expected, baseline = works, seconds
+            elif works != expected:
+                raise AssertionError(f'{path} produced different JSON at {scale} works')
+            print(f'{scale:>8} {path:<24} {seconds:>8.3f} {len(body) / 2 ** 20:>7.2f} {baseline / seconds:>7.1f}x')
+        conn.close()
+
+
+if __name__ == '__main__':
+    # python benchmark_json.py [scale ...]
+    benchmark([int(scale) for scale in sys.argv[1:]] or BENCHMARK_SCALES)
@@ -0,0 +1,88 @@
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+from classes import Work, WorkStore
+from database import DATABASE_FILE
+
+# Catalogue sizes compared, the bundled works are repeated to reach them
+BENCHMARK_SCALES = (1_000, 10_000, 100_000)
+WORKS_QUERY = '''
+    SELECT w.*, c.name as composer
+    FROM works w
+    JOIN composers c ON w.composer_id = c.composer_id
+'''
+
+
+def build_catalogue(scale: int):
+    """An in-memory copy of the database whose works are repeated (with distinct titles and links) up to scale rows"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"ATTACH DATABASE 'file:{DATABASE_FILE}?mode=ro' AS source")
+    conn.execute('CREATE TABLE composers AS SELECT * FROM source.composers')
+    conn.execute('CREATE TABLE works AS SELECT * FROM source.works WHERE 0')
+    source_count = conn.execute('SELECT COUNT(*) FROM source.works').fetchone()[0]
+    for copy in range(-(-scale // source_count)):
+        conn.execute('''
+            INSERT INTO works (work_id, composer_id, title, genre, creation_year, detail_url, decade, xml_path)
+            SELECT work_id + ? * ?, composer_id, title || ?, genre, creation_year, detail_url || ?, decade, xml_path
+            FROM source.works
+        ''', (copy, source_count, f' #{copy}' if copy else '', f'&copy={copy}' if copy else ''))
+    conn.execute('DELETE FROM works WHERE rowid > ?', (scale,))
+    conn.commit()
+    conn.execute('DETACH DATABASE source')
+    return conn
+
+
+def load_work_objects(conn):
+    """The previous loading path: one sqlite3.Row and one Work per row"""
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(WORKS_QUERY).fetchall()
+    return [
+        Work(work_id=row['work_id'], composer_id=row['composer_id'], title=row['title'], genre=row['genre'],
+             creation_year=row['creation_year'], detail_url=row['detail_url'], composer=row['composer'],
+             decade=row['decade'])
+        for row in rows
+    ]
+
+
+def load_work_store(conn):
+    conn.row_factory = None
+    return WorkStore.from_cursor(conn.execute(WORKS_QUERY))
+
+
+def measure(fn, *args) -> dict:
+    """Wall time, memory still held by the result, peak traced memory and number of live blocks allocated by fn"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    tracemalloc.stop()
+    del result
+    return {'seconds': elapsed, 'retained_mb': retained / 2 ** 20, 'peak_mb': peak / 2 ** 20, 'blocks': blocks}
+
+
+def benchmark(scales=BENCHMARK_SCALES):
+    """Compare Work objects with WorkStore for loading the catalogue and for turning it into dicts for JSON"""
+    print(f"{'works':>8} {'operation':<28} {'seconds':>8} {'retained MB':>12} {'peak MB':>8} {'blocks':>9}")
+    for scale in scales:
+        conn = build_catalogue(scale)
+        cases = {
+            'load Work objects': lambda: load_work_objects(conn),
+            'load WorkStore': lambda: load_work_store(conn),
+            'Work objects -> to_dict': lambda: [work.to_dict() for work in load_work_objects(conn)],
+            'WorkStore -> to_dicts': lambda: load_work_store(conn).to_dicts(),
+        }
+        for operation, fn in cases.items():
+            result = measure(fn)
+            print(f"{scale:>8} {operation:<28} {result['seconds']:>8.3f} {result['retained_mb']:>12.2f} "
+                  f"{result['peak_mb']:>8.2f} {result['blocks']:>9}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    # python benchmark_work_store.py [scale ...]
+    benchmark([int(scale) for scale in sys.argv[1:]] or BENCHMARK_SCALES)
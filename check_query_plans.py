@@ -0,0 +1,104 @@
+"""
+Query-plan regression check: call every API endpoint, capture the SQL it runs and fail if
+EXPLAIN QUERY PLAN shows a full table scan that does not go through an index, or if no SQL was captured
+Usage: python check_query_plans.py
+"""
+import re
+import sys
+
+import database
+
+# SQL executed by the app's connections, recorded by a trace callback installed when each connection opens
+# The hook is added before the app is imported, so every connection of the app is traced from the start
+traced_statements = []
+database.connection_hooks.append(lambda conn: conn.set_trace_callback(traced_statements.append))
+
+from app import app, encode_cursor, load_catalogue, response_cache
+
+# (endpoint, query string parameters, whether the endpoint returns a whole table and may scan it)
+API_REQUESTS = [
+    ('/api/genres', {}, False),
+    ('/api/decades', {}, False),
+    ('/api/composers', {}, False),
+    ('/api/composers/1', {}, False),
+    ('/api/composers/stats', {}, False),
+    ('/api/works', {}, True),
+    ('/api/works', {'keyword': 'sang'}, False),
+    ('/api/works', {'keyword': 'jeg sa kun'}, False),
+    ('/api/works', {'keyword': 'de'}, True),
+    ('/api/works', {'type': 'Song'}, False),
+    ('/api/works', {'decade': '1890s'}, False),
+    ('/api/works', {'keyword': 'sang', 'type': 'Song', 'decade': '1890s'}, False),
+    ('/api/works', {'sort': 'title', 'limit': '50', 'total': '1'}, True),
+    ('/api/works', {'sort': 'title', 'limit': '50', 'cursor': encode_cursor('title', 'asc', ['M', 0])}, False),
+    ('/api/works', {'sort': 'year', 'order': 'desc', 'limit': '50',
+                    'cursor': encode_cursor('year', 'desc', [1900, 0])}, False),
+    ('/api/works', {'sort': 'composer', 'limit': '50',
+                    'cursor': encode_cursor('composer', 'asc', ['Carl Nielsen', 'M', 0])}, False),
+    ('/api/works', {'decade': '1890s', 'sort': 'title', 'limit': '50'}, False),
+    ('/api/search', {'keyword': 'sang', 'type': 'Song'}, False),
+    ('/api/works/export', {'decade': '1890s', 'sort': 'year', 'order': 'desc'}, False),
+    ('/api/works/export', {'keyword': 'sang', 'type': 'Song', 'sort': 'composer', 'format': 'jsonl'}, False),
+]
+# /api/suggest is left out: it answers from an in-memory index without any SQL
+
+# A plan step that reads a whole table without an index, e.g. "SCAN works" or "SCAN w"
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+# Subquery results the plan refers to by name; scanning them does not read a table
+SUBQUERY = re.compile(r'^(?:MATERIALIZE|CO-ROUTINE) (\w+)$')
+
+
+def capture_statements(path, params):
+    """Request an endpoint and return the SQL statements it executed, with parameters expanded"""
+    # A cached response would run no SQL
+    response_cache.clear()
+    traced_statements.clear()
+    response = app.test_client().get(path, query_string=params)
+    # Streamed bodies (exports) run their queries as they are read
+    body = response.get_data(as_text=True)
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} {params} returned {response.status_code}: {body}')
+    return [statement for statement in traced_statements if statement.lstrip().upper().startswith(('SELECT', 'WITH'))]
+
+
+def full_scans(conn, statement):
+    """Return the plan steps of a statement that scan a table without an index"""
+    steps = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}').fetchall()]
+    subqueries = {match.group(1) for match in map(SUBQUERY.match, steps) if match}
+    return [step for step in steps if FULL_SCAN.match(step) and FULL_SCAN.match(step).group(1) not in subqueries]
+
+
+def check_query_plans():
+    """
+    Return a list of (endpoint, parameters, plan step, SQL) for every unexpected full table scan, and for every
+    endpoint that ran no SQL (plan step None), since its queries would go unchecked
+    """
+    failures = []
+    load_catalogue()
+    conn = database.get_db_connection()
+    # The catalogue does not change during the check: its version is read once, so the version check of a request
+    # is not mistaken for SQL of the endpoint
+    response_cache.version()
+    response_cache.version_check_interval = float('inf')
+    for path, params, may_scan in API_REQUESTS:
+        if may_scan:
+            continue
+        statements = capture_statements(path, params)
+        if not statements:
+            failures.append((path, params, None, None))
+        for statement in statements:
+            for step in full_scans(conn, statement):
+                failures.append((path, params, step, ' '.join(statement.split())))
+    conn.close()
+    return failures
+
+
+if __name__ == '__main__':
+    failures = check_query_plans()
+    for path, params, step, statement in failures:
+        if step is None:
+            print(f'{path} {params}: no SQL statement captured')
+        else:
+            print(f'{path} {params}: {step}\n    {statement}')
+    print(f'{len(failures)} problems found (full table scans, endpoints without captured SQL)')
+    sys.exit(1 if failures else 0)
@@ -1,4 +1,11 @@
+import itertools
+import sys
+from array import array
+
+
 class Composer:
+    __slots__ = ('composer_id', 'name', 'catalogue_source')
+
     def __init__(self, composer_id: int | None = None, name: str | None = None, catalogue_source: str | None = None):
         self.composer_id = composer_id
         self.name = name
@@ -6,6 +13,9 @@ class Composer:
 
 
 class Work:
+    __slots__ = ('work_id', 'composer_id', 'title', 'genre', 'creation_year', 'detail_url', 'composer', 'decade',
+                 'xml_path')
+
     def __init__(self, work_id: int | None = None,
                  composer_id: int | None = None,
                  title: str | None = None,
@@ -13,7 +23,8 @@ class Work:
                  creation_year: int | None = None,
                  detail_url: str | None = None,
                  composer: str | None = None,
-                 decade: str | None = None):
+                 decade: str | None = None,
+                 xml_path: str | None = None):
         self.work_id = work_id
         self.composer_id = composer_id
         self.title = title
@@ -22,6 +33,7 @@ class Work:
         self.detail_url = detail_url
         self.composer = composer
         self.decade = decade
+        self.xml_path = xml_path
 
     def to_dict(self):
         return {
@@ -32,5 +44,109 @@ class Work:
             'creation_year': self.creation_year,
             'detail_url': self.detail_url,
             'composer': self.composer,
-            'decade':self.decade
+            'decade': self.decade
         }
+
+
+class StringColumn:
+    """
+    Strings stored back to back as UTF-8 in one bytearray, row i is buffer[offsets[i]:offsets[i + 1]]
+    Costs about one byte per character plus an 8-byte offset, instead of a str object of 50+ bytes per row
+    """
+    __slots__ = ('buffer', 'offsets')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('q', [0])
+
+    def append(self, value: str):
+        self.buffer += value.encode('utf-8')
+        self.offsets.append(len(self.buffer))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index) -> str:
+        if index < 0:
+            index += len(self)
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def __iter__(self):
+        buffer, offsets = self.buffer, self.offsets
+        # Pairs of consecutive offsets, without indexing the array twice per row
+        for start, end in zip(offsets, itertools.islice(offsets, 1, None)):
+            yield buffer[start:end].decode('utf-8')
+
+
+class WorkStore:
+    """
+    Column-oriented collection of works: integer columns are arrays, titles and links are StringColumns,
+    genre, decade and composer strings are interned so every row shares one object per distinct value,
+    and no per-row object exists until a row is asked for
+    """
+    # Fields of a work, in the order of Work.to_dict
+    FIELDS = ('work_id', 'composer_id', 'title', 'genre', 'creation_year', 'detail_url', 'composer', 'decade')
+    # Rows fetched from a cursor at a time by from_cursor
+    FETCH_SIZE = 1000
+
+    def __init__(self):
+        self.work_ids = array('q')
+        self.composer_ids = array('q')
+        self.titles = StringColumn()
+        self.genres = []
+        self.creation_years = array('q')
+        self.detail_urls = StringColumn()
+        self.composers = []
+        self.decades = []
+
+    @classmethod
+    def from_cursor(cls, cursor, fetch_size: int = FETCH_SIZE):
+        """Fill a store from an executed cursor whose columns include FIELDS, fetching fetch_size rows at a time"""
+        store = cls()
+        while rows := cursor.fetchmany(fetch_size):
+            store.extend(rows, cursor.description)
+        return store
+
+    def extend(self, rows, description):
+        """Append rows (tuples or sqlite3.Row) whose column names are given by a cursor description"""
+        positions = [column[0] for column in description]
+        work_id, composer_id, title, genre, creation_year, detail_url, composer, decade = (
+            positions.index(field) for field in self.FIELDS
+        )
+        intern = sys.intern
+        for row in rows:
+            self.work_ids.append(row[work_id])
+            self.composer_ids.append(row[composer_id])
+            self.titles.append(row[title])
+            self.genres.append(intern(row[genre]))
+            self.creation_years.append(row[creation_year])
+            self.detail_urls.append(row[detail_url])
+            self.composers.append(intern(row[composer]))
+            self.decades.append(intern(row[decade]))
+
+    def columns(self):
+        """The columns in FIELDS order"""
+        return (self.work_ids, self.composer_ids, self.titles, self.genres, self.creation_years, self.detail_urls,
+                self.composers, self.decades)
+
+    def __len__(self):
+        return len(self.work_ids)
+
+    def __getitem__(self, index) -> Work:
+        return Work(*(column[index] for column in self.columns()))
+
+    def __iter__(self):
+        for values in zip(*self.columns()):
+            yield Work(*values)
+
+    def to_dicts(self) -> list:
+        """
+        Every work as a dict in the format of Work.to_dict, built straight from the columns
+        Slower than Work.to_dict on loaded Work objects, since every string and integer is created anew from the
+        compact columns: the store saves memory while the works are held, not time when they are all turned into dicts
+        """
+        return [
+            {'work_id': work_id, 'composer_id': composer_id, 'title': title, 'genre': genre,
+             'creation_year': creation_year, 'detail_url': detail_url, 'composer': composer, 'decade': decade}
+            for work_id, composer_id, title, genre, creation_year, detail_url, composer, decade in zip(*self.columns())
+        ]
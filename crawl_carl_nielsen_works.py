@@ -1,24 +1,26 @@
+import asyncio
 import os
-import requests
+from urllib.parse import urljoin
+
 from bs4 import BeautifulSoup
-import csv
-import time
 
-# Target URL
-base_url = "https://www.kb.dk/dcm/cnw/index.xq"
-# Request headers (simulate browser visit to avoid anti-crawling)
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-}
+from crawl_engine import CrawlEngine, FetchError, download_xml_file
+
+# Root of the Carl Nielsen Works catalogue, listing, detail and download links are resolved against it
+catalogue_url = "https://www.kb.dk/dcm/cnw/"
+# Number of listing pages (20 works each)
+listing_pages = 23
+
+
+def listing_page_url(page, root_url=catalogue_url):
+    return urljoin(root_url, f'index.xq?page={page}&itemsPerPage=20&sortby=null%2Cwork_number')
 
 
-def get_xml_download_url(detail_url):
+async def get_xml_download_url(engine, detail_url):
     """Extract the actual download link of the XML file from the detail page"""
     try:
-        response = requests.get(detail_url, headers=headers, timeout=30)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, "html.parser")
+        response = await engine.fetch(detail_url)
+        soup = BeautifulSoup(response.body, "html.parser")
 
         # Find XML download button (locate by button text and link characteristics)
         xml_button = soup.select_one("a[href*='download'][href*='xml'], a[href*='DOWNLOAD'][href*='XML']")
@@ -30,105 +32,86 @@ def get_xml_download_url(detail_url):
             print(f"XML download link not found: {detail_url}")
             return None
 
-        # Extract and complete the download link
-        xml_relative_url = xml_button["href"]
-        if xml_relative_url.startswith("http"):
-            return xml_relative_url
-        elif xml_relative_url.startswith("/"):
-            return f"https://www.kb.dk{xml_relative_url}"
-        else:
-            return f"https://www.kb.dk/dcm/cnw/{xml_relative_url.lstrip('./')}"
+        # Complete the download link relative to the detail page
+        return urljoin(detail_url, xml_button["href"])
 
-    except requests.exceptions.RequestException as e:
-        print(f"Detail page request failed ({detail_url}): {e}")
+    except FetchError as e:
+        print(f"Detail page request failed ({detail_url}): {e.reason}")
         return None
     except Exception as e:
         print(f"Failed to extract XML link ({detail_url}): {e}")
         return None
 
 
-def download_xml(xml_location, detail_url):
-    xml_download_url = get_xml_download_url(detail_url)
+async def download_xml(engine, xml_location, detail_url, cached_work=None, refresh=False):
+    """
+    Download the XML file of a work into xml_location and return its manifest fields (see download_xml_file)
+    The download link recorded in cached_work is reused, so the detail page is only fetched for new works
+    """
+    xml_download_url = (cached_work or {}).get("XML Download Link") or await get_xml_download_url(engine, detail_url)
+    if not xml_download_url:
+        return None
     xml_filename = xml_download_url.split('=')[1]
     xml_filename = os.path.join(xml_location, xml_filename)
-    if os.path.exists(xml_filename):
-        return xml_filename
-    # print(xml_download_url)
-    try:
-        # Send GET request to get content
-        response = requests.get(xml_download_url, timeout=10)  # Set timeout to avoid infinite waiting
-        response.raise_for_status()  # Check if request is successful (status code 200)
-
-        with open(xml_filename, "wb") as f:
-            f.write(response.content)  # Write binary content
-        print(f"File successfully downloaded to: {xml_filename}")
-        return xml_filename
-    except requests.exceptions.RequestException as e:
+    return await download_xml_file(engine, xml_download_url, xml_filename, cached_work, refresh)
+
+
+def parse_listing_page(body, root_url=catalogue_url):
+    """CNW numbers and detail page links of the works on a listing page"""
+    soup = BeautifulSoup(body, "html.parser")
+    # Each work is a table whose onclick attribute navigates to its detail page
+    listed_works = []
+    for work in soup.select("table.result_table"):
+        cnw_number_elem = work.select_one("td:nth-child(1)")
+        cnw_number = cnw_number_elem.get_text(strip=True) if cnw_number_elem else ""
+        onclick_attr = work.get("onclick", "")
+        if work.select_one("td:nth-child(2)") and "location.href='" in onclick_attr:
+            relative_link = onclick_attr.split("'")[1]  # Extract './document.xq?n=xx' part
+            listed_works.append((cnw_number, urljoin(root_url, relative_link)))
+        else:
+            print(f"Detail page link not found for {cnw_number or 'a work'} in the listing")
+    return listed_works
+
+
+async def crawl_work(engine, xml_location, cnw_number, detail_url, on_work=None, cached_work=None, refresh=False):
+    xml_file = await download_xml(engine, xml_location, detail_url, cached_work, refresh)
+    if not xml_file:
         return None
-    return None
-
-
-def crawl_carl_nielsen_works(xml_location):
-    works_data = []  # Store work data
-    i = 1
-    while i < 24:
-        local_works_data = []
-        url = f'https://www.kb.dk/dcm/cnw/index.xq?page={i}&itemsPerPage=20&sortby=null%2Cwork_number'
-        try:
-            # Send request to get page content
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()  # Throw exception if status code is not 200
-            response.encoding = response.apparent_encoding  # Automatically identify encoding
-
-            # Parse HTML
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            # Find work list (adjust selector according to page structure, assuming works are in table or specific container)
-            # Note: Actually need to modify selector according to real DOM structure of the page, the following is a general example
-            works = soup.select("table.result_table")  # Assuming works are in table rows
-
-            for idx, work in enumerate(works[:], 1):  # Skip header row
-                work_data = {}
-                # Extract CNW number (adjust according to page structure)
-                cnw_number = work.select_one("td:nth-child(1)").get_text(strip=True) if work.select_one("td:nth-child(1)") else ""
-                work_data["CNW Number"] = cnw_number
-                # Extract work title (Danish + English)
-                title_elem = work.select_one("td:nth-child(2)")
-                if title_elem:
-                    title_text = title_elem.get_text(strip=True, separator=" | ")
-                    # work_data["Work Title"] = title_text
-
-                    onclick_attr = work.get("onclick", "")
-                    if "location.href='" in onclick_attr:
-                        relative_link = onclick_attr.split("'")[1]  # Extract './document.xq?n=xx' part
-                        root_domain = "https://www.kb.dk/dcm/cnw"
-                        absolute_link = f"{root_domain}/{relative_link.lstrip('./')}"  # Concatenate into complete URL
-                        work_data["Detail Page Link"] = absolute_link
-                        xml_filename = download_xml(xml_location, absolute_link)
-                        work_data["XML Filename"] = xml_filename
-                if work_data["Detail Page Link"] and work_data["XML Filename"]:
-                    local_works_data.append(work_data)
-                    print(work_data)
-                else:
-                    raise Exception
-                # if work_data.get("Work Title") and work_data.get("Detail Page Link"):
-                #     works_data.append(work_data)
-                #     print(f"Scraped {cnw_number}: {work_data['Work Title']}")
-                #     print(work_data)
-                time.sleep(0.5)  # Delay to avoid being blocked due to too fast requests
-            works_data.extend(local_works_data)
-            i += 1
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-        except Exception as e:
-            # print(f"Error during crawling: {e}")
+    work_data = {"CNW Number": cnw_number, "Detail Page Link": detail_url, **xml_file}
+    print(work_data)
+    if on_work:
+        on_work(work_data)
+    return work_data
+
+
+async def crawl_carl_nielsen_works_async(engine, xml_location, root_url=catalogue_url, done_links=frozenset(),
+                                         on_work=None, cached_works=None, refresh=False):
+    """
+    Crawl every listed work on a shared CrawlEngine, downloading its XML file into xml_location
+    Listing pages and works are fetched concurrently, the result keeps the catalogue order
+    Works whose detail page link is in done_links are skipped, on_work is called with each work as soon as it is done
+    cached_works maps detail page links to the previous manifest records, used to download XML files conditionally
+    """
+    cached_works = cached_works or {}
+    os.makedirs(xml_location, exist_ok=True)
+    page_urls = [listing_page_url(page, root_url) for page in range(1, listing_pages + 1)]
+    listed_works = []
+    for page_url, response in zip(page_urls, await engine.fetch_all(page_urls)):
+        if isinstance(response, Exception):
+            print(f"Request failed: {response}")
             continue
-    # # Save data to CSV file
-    # with open("carl_nielsen_works.csv", "w", newline="", encoding="utf-8-sig") as f:
-    #     fieldnames = ["CNW Number", "Work Title", "Detail Page Link", 'XML Filename']
-    #     writer = csv.DictWriter(f, fieldnames=fieldnames)
-    #     writer.writeheader()
-    #     writer.writerows(works_data)
-
-    # print(f"\nCrawling completed! A total of {len(works_data)} works were obtained, and the data has been saved to carl_nielsen_works.csv")
-    return works_data
+        listed_works.extend(parse_listing_page(response.body, root_url))
+
+    works_data = await engine.map(
+        lambda listed_work: crawl_work(engine, xml_location, *listed_work, on_work,
+                                       cached_works.get(listed_work[1]), refresh),
+        [listed_work for listed_work in listed_works if listed_work[1] not in done_links]
+    )
+    return [work_data for work_data in works_data if work_data]
+
+
+def crawl_carl_nielsen_works(xml_location, root_url=catalogue_url):
+    async def crawl():
+        async with CrawlEngine() as engine:
+            return await crawl_carl_nielsen_works_async(engine, xml_location, root_url)
+    return asyncio.run(crawl())
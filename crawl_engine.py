@@ -0,0 +1,227 @@
+import asyncio
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Maximum number of requests in flight at once, across all hosts
+CRAWL_CONCURRENCY = int(os.environ.get('CRAWL_CONCURRENCY', '8'))
+# Requests per second allowed to each host, and how many may be sent back to back after an idle period
+HOST_RATE_LIMIT = float(os.environ.get('CRAWL_RATE_LIMIT', '4'))
+HOST_BURST = 4
+# Attempts after the first one for failed connections, timeouts and the statuses below
+MAX_RETRIES = 3
+# Seconds waited before the first retry, doubled for every further retry
+RETRY_BACKOFF = 1.0
+# Responses that are worth retrying: throttling and temporary server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Seconds allowed for a whole request (connect + response body)
+REQUEST_TIMEOUT = 30
+# Seconds an idle keep-alive connection stays open for reuse
+KEEPALIVE_TIMEOUT = 30
+# Request headers (simulate browser visit to avoid anti-crawling)
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+
+class FetchError(Exception):
+    """A request that still failed after all retries, or that failed with a status not worth retrying"""
+
+    def __init__(self, url, reason):
+        super().__init__(f"{url}: {reason}")
+        self.url = url
+        self.reason = reason
+
+
+class FetchResult:
+    """Status, headers and body of a completed response"""
+
+    def __init__(self, url, status, headers, body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class TokenBucket:
+    """
+    Allows rate acquisitions per second on average and up to capacity of them at once
+    Waiters are served in arrival order
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CrawlEngine:
+    """
+    Shared HTTP client of the crawlers, used as an async context manager
+    Connections are kept alive and reused, at most concurrency requests run at once,
+    each host gets its own token bucket and failed requests are retried with exponential backoff
+    """
+
+    def __init__(self, concurrency: int = CRAWL_CONCURRENCY, rate_limit: float = HOST_RATE_LIMIT,
+                 burst: int = HOST_BURST, max_retries: int = MAX_RETRIES, retry_backoff: float = RETRY_BACKOFF):
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._session = None
+        self._semaphore = None
+        self._buckets = {}
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'bytes': 0, 'not_modified': 0}
+        # Paths of the files that download() created or replaced with new content
+        self.changed_files = []
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=KEEPALIVE_TIMEOUT)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    def _bucket(self, url) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_limit, self.burst)
+        return self._buckets[host]
+
+    def _retry_delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Backoff before the given retry (1-based), a numeric Retry-After header takes precedence"""
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.retry_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    async def fetch(self, url, headers=None) -> FetchResult:
+        """
+        GET url and return the response, retrying connection errors, timeouts and RETRY_STATUSES
+        Raises FetchError once the retries are used up or for any other status of 400 and above
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+            await self._bucket(url).acquire()
+            async with self._semaphore:
+                self.stats['requests'] += 1
+                try:
+                    async with self._session.get(url, headers=headers) as response:
+                        body = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    reason = repr(e)
+                    delay = self._retry_delay(attempt + 1)
+                    continue
+            self.stats['bytes'] += len(body)
+            if response.status in RETRY_STATUSES:
+                reason = f"HTTP {response.status}"
+                delay = self._retry_delay(attempt + 1, response.headers.get('Retry-After'))
+                continue
+            if response.status >= 400:
+                self.stats['failures'] += 1
+                raise FetchError(url, f"HTTP {response.status}")
+            return FetchResult(str(response.url), response.status, response.headers, body)
+        self.stats['failures'] += 1
+        raise FetchError(url, f"{reason} after {self.max_retries + 1} attempts")
+
+    async def download(self, url, path, etag: str | None = None, last_modified: str | None = None):
+        """
+        GET url into path, sending the validators of the copy on disk as If-None-Match / If-Modified-Since
+        A 200 body is written atomically (temporary file + rename) and only if it differs from the copy on disk,
+        so unchanged files keep their mtime; changed paths are recorded in changed_files
+        Return the response and whether the file changed
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = await self.fetch(url, headers)
+        if response.status == 304:
+            self.stats['not_modified'] += 1
+            return response, False
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == response.body:
+                    return response, False
+        except FileNotFoundError:
+            pass
+        tmp_path = path + '.part'
+        with open(tmp_path, 'wb') as f:
+            f.write(response.body)
+        os.replace(tmp_path, path)
+        self.changed_files.append(path)
+        return response, True
+
+    async def map(self, fn, items) -> list:
+        """
+        Await fn(item) for every item with at most concurrency of them running at once, results keep the order of items
+        Each item then finishes soon after it starts, instead of all of them queueing for the rate limit together
+        """
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run(item):
+            async with slots:
+                return await fn(item)
+        return await asyncio.gather(*(run(item) for item in items))
+
+    async def fetch_all(self, urls, headers=None) -> list:
+        """Fetch urls concurrently, results (a FetchResult or the FetchError) keep the order of urls"""
+        return await asyncio.gather(*(self.fetch(url, headers) for url in urls), return_exceptions=True)
+
+
+async def download_xml_file(engine, xml_download_url, xml_filename, cached_work=None, refresh: bool = False):
+    """
+    Make sure xml_filename holds the XML file of a work and return its manifest fields, or None if the download failed
+    An existing file is kept as is, unless refresh is set: then it is downloaded again conditionally,
+    using the ETag / Last-Modified recorded for it in cached_work (its previous manifest record)
+    """
+    cached_work = cached_work or {}
+    xml_file = {
+        "XML Filename": xml_filename,
+        "XML Download Link": xml_download_url,
+        "ETag": cached_work.get("ETag"),
+        "Last-Modified": cached_work.get("Last-Modified"),
+    }
+    exists = os.path.exists(xml_filename)
+    if exists and not refresh:
+        return xml_file
+    try:
+        if exists:
+            response, changed = await engine.download(xml_download_url, xml_filename,
+                                                      xml_file["ETag"], xml_file["Last-Modified"])
+        else:
+            response, changed = await engine.download(xml_download_url, xml_filename)
+    except FetchError as e:
+        print(f"XML download failed ({xml_download_url}): {e.reason}")
+        return xml_file if exists else None
+    if response.status == 200:
+        xml_file["ETag"] = response.headers.get("ETag")
+        xml_file["Last-Modified"] = response.headers.get("Last-Modified")
+        if changed:
+            print(f"File successfully downloaded to: {xml_filename}")
+    return xml_file
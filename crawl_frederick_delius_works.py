@@ -1,74 +1,84 @@
+import asyncio
 import os
+from urllib.parse import urljoin
 
-import requests
 from bs4 import BeautifulSoup
 
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-}
+from crawl_engine import CrawlEngine, download_xml_file
+
+# Root of the Delius catalogue, listing and detail links are resolved against it
+catalogue_url = "https://delius.music.ox.ac.uk/catalogue/"
+# Number of listing pages
+listing_pages = 7
+
+
+def listing_page_url(page, root_url=catalogue_url):
+    return urljoin(root_url, f'navigation.html?page={page}')
 
 
 def get_xml_download_url(detail_url: str):
     return detail_url.replace("document", 'download_xml')
 
 
-def download_xml(xml_location, detail_url):
+async def download_xml(engine, xml_location, detail_url, cached_work=None, refresh=False):
+    """Download the XML file of a work into xml_location and return its manifest fields (see download_xml_file)"""
     xml_download_url = get_xml_download_url(detail_url)
     xml_filename = xml_download_url.split('=')[1]
     xml_filename = os.path.join(xml_location, xml_filename)
-    if os.path.exists(xml_filename):
-        return xml_filename
-    # print(xml_download_url)
-    try:
-        # Send GET request to get content
-        response = requests.get(xml_download_url, timeout=10)  # Set timeout to avoid infinite waiting
-        response.raise_for_status()  # Check if request is successful (status code 200)
-
-        with open(xml_filename, "wb") as f:
-            f.write(response.content)  # Write binary content
-        print(f"File successfully downloaded to: {xml_filename}")
-        return xml_filename
-    except requests.exceptions.RequestException as e:
-        return None
-
-
-def crawl_frederick_delius_works(xml_location):
-    works_data = []  # Store work data
-    base_domain = "https://delius.music.ox.ac.uk/catalogue"
-    for i in range(1, 8):
-        url = f'https://delius.music.ox.ac.uk/catalogue/navigation.html?page={i}'
-        try:
-            # Send request to get page content
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()  # Throw exception if status code is not 200
-            response.encoding = response.apparent_encoding  # Automatically identify encoding
-
-            # Parse HTML
-            soup = BeautifulSoup(response.text, "html.parser")
-            works = soup.select("div.results")
-            # print(len(works))
-            work_items = soup.find_all("div", class_="workListItem")
-            for item in work_items:
-                work_data = {}
-                a_tag = item.find_parent("a")
-                if a_tag and "href" in a_tag.attrs:
-                    relative_href = a_tag["href"]
-                    if relative_href.startswith("./"):
-                        full_href = f"{base_domain}/{relative_href.lstrip('./')}"
-                    elif relative_href.startswith("/"):
-                        full_href = f"{base_domain}{relative_href}"
-                    else:
-                        full_href = relative_href
-                    work_data["Detail Page Link"] = full_href
-                else:
-                    work_data["Detail Page Link"] = None
-                xml_filename = download_xml(xml_location, work_data["Detail Page Link"])
-                work_data["XML Filename"] = xml_filename
-                print(work_data)
-                works_data.append(work_data)
-            print(len(work_items))
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-        except Exception as e:
-            print(f"Error during crawling: {e}")
-    return works_data
+    return await download_xml_file(engine, xml_download_url, xml_filename, cached_work, refresh)
+
+
+def parse_listing_page(body, root_url=catalogue_url):
+    """Detail page links of the works on a listing page (None for a work without a link)"""
+    soup = BeautifulSoup(body, "html.parser")
+    detail_urls = []
+    for item in soup.find_all("div", class_="workListItem"):
+        a_tag = item.find_parent("a")
+        if a_tag and "href" in a_tag.attrs:
+            detail_urls.append(urljoin(root_url, a_tag["href"]))
+        else:
+            detail_urls.append(None)
+    return detail_urls
+
+
+async def crawl_work(engine, xml_location, detail_url, on_work=None, cached_work=None, refresh=False):
+    work_data = {"Detail Page Link": detail_url, "XML Filename": None}
+    if detail_url:
+        work_data.update(await download_xml(engine, xml_location, detail_url, cached_work, refresh) or {})
+    print(work_data)
+    if on_work:
+        on_work(work_data)
+    return work_data
+
+
+async def crawl_frederick_delius_works_async(engine, xml_location, root_url=catalogue_url, done_links=frozenset(),
+                                             on_work=None, cached_works=None, refresh=False):
+    """
+    Crawl every listed work on a shared CrawlEngine, downloading its XML file into xml_location
+    Listing pages and works are fetched concurrently, the result keeps the catalogue order
+    Works whose detail page link is in done_links are skipped, on_work is called with each work as soon as it is done
+    cached_works maps detail page links to the previous manifest records, used to download XML files conditionally
+    """
+    cached_works = cached_works or {}
+    os.makedirs(xml_location, exist_ok=True)
+    page_urls = [listing_page_url(page, root_url) for page in range(1, listing_pages + 1)]
+    detail_urls = []
+    for page_url, response in zip(page_urls, await engine.fetch_all(page_urls)):
+        if isinstance(response, Exception):
+            print(f"Request failed: {response}")
+            continue
+        page_detail_urls = parse_listing_page(response.body, root_url)
+        print(f"{len(page_detail_urls)} works listed on {page_url}")
+        detail_urls.extend(page_detail_urls)
+
+    return await engine.map(
+        lambda detail_url: crawl_work(engine, xml_location, detail_url, on_work, cached_works.get(detail_url), refresh),
+        [detail_url for detail_url in detail_urls if detail_url not in done_links]
+    )
+
+
+def crawl_frederick_delius_works(xml_location, root_url=catalogue_url):
+    async def crawl():
+        async with CrawlEngine() as engine:
+            return await crawl_frederick_delius_works_async(engine, xml_location, root_url)
+    return asyncio.run(crawl())
@@ -0,0 +1,125 @@
+import ast
+import json
+import os
+import shutil
+
+# Extension of crawl manifests: one JSON object per crawled work, appended as soon as the work is done
+MANIFEST_SUFFIX = '.jsonl'
+# Extension of the manifests written by older crawlers: one Python dict repr per line
+LEGACY_MANIFEST_SUFFIX = '.txt'
+# Suffix of the manifest being written by a crawl, it replaces the manifest only once the crawl has finished
+PARTIAL_SUFFIX = '.partial'
+
+
+def manifest_path(path):
+    """The JSONL manifest for a configured manifest path, older configs still name the legacy .txt file"""
+    root, ext = os.path.splitext(path)
+    return root + MANIFEST_SUFFIX if ext == LEGACY_MANIFEST_SUFFIX else path
+
+
+def partial_manifest_path(path):
+    """The file a crawl writes the manifest into, next to the manifest"""
+    return manifest_path(path) + PARTIAL_SUFFIX
+
+
+def migrate_legacy_manifest(path):
+    """
+    Convert the legacy .txt manifest next to a JSONL manifest path into JSONL, if the JSONL file does not exist yet
+    The lines are read with ast.literal_eval, so nothing in them is executed; return whether a file was migrated
+    """
+    legacy_path = os.path.splitext(path)[0] + LEGACY_MANIFEST_SUFFIX
+    if os.path.exists(path) or not os.path.exists(legacy_path):
+        return False
+    tmp_path = path + '.tmp'
+    with open(legacy_path, 'r', encoding='utf-8') as legacy_file, \
+            open(tmp_path, 'w', encoding='utf-8') as f:
+        for line in legacy_file:
+            if line.strip():
+                f.write(json.dumps(ast.literal_eval(line.strip()), ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+    print(f"Migrated {legacy_path} to {path}")
+    return True
+
+
+def read_manifest(path):
+    """
+    Yield the work records of a manifest one line at a time, migrating a legacy .txt manifest first
+    A last line cut off by a crash during the crawl is skipped
+    """
+    path = manifest_path(path)
+    migrate_legacy_manifest(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping an incomplete manifest line in {path}")
+
+
+class ManifestWriter:
+    """
+    Appends work records to the partial manifest, flushing each one so a crash loses at most the work in progress
+    The partial manifest replaces the manifest when the block exits without an exception, so an interrupted crawl
+    never leaves a manifest that lacks works (database.py sync would remove them)
+    Unless resuming, the partial manifest is started over; resuming continues it, or starts it from the manifest
+    Set complete once every listing page and work was fetched: otherwise the previous records of the works that were
+    not written (a listing page or detail page that failed) are kept, only a complete crawl drops delisted works
+    """
+
+    def __init__(self, path, resume: bool = False):
+        self.path = manifest_path(path)
+        self.partial_path = partial_manifest_path(path)
+        self.resume = resume
+        self.complete = False
+        self._file = None
+
+    def __enter__(self):
+        if not self.resume:
+            self._file = open(self.partial_path, 'w', encoding='utf-8')
+            return self
+        if not os.path.exists(self.partial_path):
+            migrate_legacy_manifest(self.path)
+            if os.path.exists(self.path):
+                shutil.copyfile(self.path, self.partial_path)
+        self._file = open(self.partial_path, 'a+', encoding='utf-8')
+        # A line cut off by a crash is ended, so the next record starts on a line of its own
+        if self._file.tell() and not self._last_line_ended():
+            self._file.write('\n')
+        return self
+
+    def _last_line_ended(self) -> bool:
+        with open(self.partial_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and not self.complete:
+            self._keep_previous_records()
+        if exc_type is None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+        if exc_type is None:
+            os.replace(self.partial_path, self.path)
+
+    def _keep_previous_records(self):
+        """Append the records of the previous manifest whose works were not written by this crawl"""
+        if not os.path.exists(self.path):
+            return
+        self._file.flush()
+        written = {work_data.get('Detail Page Link') for work_data in read_manifest(self.partial_path)}
+        kept = 0
+        for work_data in read_manifest(self.path):
+            link = work_data.get('Detail Page Link')
+            if link and link not in written:
+                written.add(link)
+                self.write(work_data)
+                kept += 1
+        if kept:
+            print(f"Kept the previous records of {kept} works that were not crawled again in {self.path}")
+
+    def write(self, work_data):
+        self._file.write(json.dumps(work_data, ensure_ascii=False) + '\n')
+        self._file.flush()
@@ -1,23 +1,83 @@
+import asyncio
 import os.path
+import sys
+import time
+
+from crawl_engine import CrawlEngine
+from crawl_manifest import ManifestWriter, partial_manifest_path, read_manifest, MANIFEST_SUFFIX
+from crawl_carl_nielsen_works import crawl_carl_nielsen_works_async
+from crawl_frederick_delius_works import crawl_frederick_delius_works_async
+from data_clean import load_composers, normalize_xml_path
+
+# Crawler of each composer in composers.json
+CRAWLERS = {
+    'Carl Nielsen': crawl_carl_nielsen_works_async,
+    'Frederick Delius': crawl_frederick_delius_works_async,
+}
+
+
+def read_cached_works(manifest) -> dict:
+    """The records of a manifest by detail page link, only works whose XML file is on disk"""
+    try:
+        return {
+            work_data['Detail Page Link']: work_data for work_data in read_manifest(manifest)
+            if work_data.get('XML Filename') and os.path.exists(normalize_xml_path(work_data['XML Filename']))
+        }
+    except FileNotFoundError:
+        return {}
+
+
+async def crawl_composer(engine, composer_config, resume: bool = False, refresh: bool = False):
+    """
+    Crawl one composer's catalogue, appending each work to the composer's partial manifest as soon as it is done
+    The previous manifest supplies the download links and validators of the works already downloaded
+    Resuming skips the works of the partial manifest left by an interrupted crawl, or else those of the manifest
+    """
+    composer = composer_config['name']
+    manifest = composer_config.get('manifest', f'{composer}{MANIFEST_SUFFIX}')
+    cached_works = read_cached_works(manifest)
+    done_links = set()
+    if resume:
+        partial_manifest = partial_manifest_path(manifest)
+        resumed_works = read_cached_works(partial_manifest) if os.path.exists(partial_manifest) else cached_works
+        cached_works = {**cached_works, **resumed_works}
+        done_links = set(resumed_works)
+    if done_links:
+        print(f"Resuming {composer}: skipping {len(done_links)} works already in the manifest")
+    failures = engine.stats['failures']
+    with ManifestWriter(manifest, resume) as writer:
+        works = await CRAWLERS[composer](engine, os.path.join('xml-files', composer), done_links=done_links,
+                                         on_work=writer.write, cached_works=cached_works, refresh=refresh)
+        # A request that failed after its retries (listing page, detail page, download) may have left works out;
+        # the engine is shared, so a failure of another composer's crawl in the meantime counts as well
+        writer.complete = engine.stats['failures'] == failures
+    print(f"{composer}: {len(works)} works crawled")
+    return works
+
+
+async def crawl_all(resume: bool = False, refresh: bool = False):
+    """
+    Crawl all composers at once on one engine, each host is rate limited on its own
+    Return the crawled works of each composer and the XML files that were added or changed
+    """
+    async with CrawlEngine() as engine:
+        results = await asyncio.gather(*(
+            crawl_composer(engine, composer_config, resume, refresh)
+            for composer_config in load_composers() if composer_config['name'] in CRAWLERS
+        ))
+        print(f"HTTP: {engine.stats}")
+    return results, engine.changed_files
 
-from crawl_carl_nielsen_works import crawl_carl_nielsen_works
-from crawl_frederick_delius_works import crawl_frederick_delius_works
 
 if __name__ == "__main__":
-    carl_nielsen_works = crawl_carl_nielsen_works(os.path.join('xml-files', 'Carl Nielsen'))
-    print(len(carl_nielsen_works))
-    for work in carl_nielsen_works:
-        print(work)
-    with open('Carl Nielsen.txt', 'w') as f:
-        for work in carl_nielsen_works:
-            f.write(str(work))
-            f.write('\n')
-
-    frederick_delius_works = crawl_frederick_delius_works(os.path.join('xml-files', 'Frederick Delius'))
-    print(len(frederick_delius_works))
-    for work in frederick_delius_works:
-        print(work)
-    with open('Frederick Delius.txt', 'w') as f:
-        for work in frederick_delius_works:
-            f.write(str(work))
-            f.write('\n')
+    # python crawler.py resume: keep the manifests and only crawl works that are not in them yet
+    # python crawler.py refresh: download every XML file again if it changed upstream (conditional requests)
+    mode = sys.argv[1] if len(sys.argv) > 1 else None
+    start = time.perf_counter()
+    _, changed_files = asyncio.run(crawl_all(resume=mode == 'resume', refresh=mode == 'refresh'))
+    print(f"Crawl finished in {time.perf_counter() - start:.1f}s")
+    print(f"{len(changed_files)} XML files added or changed:")
+    for xml_path in changed_files:
+        print(f"  {xml_path}")
+    if changed_files:
+        print("Run 'python database.py sync' to re-import them")
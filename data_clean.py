@@ -1,33 +1,133 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from lxml import etree
 from classes import Work
+from crawl_manifest import read_manifest, MANIFEST_SUFFIX
+from parse_cache import ParseCache, PARSE_CACHE_FILE
+
+# Number of worker processes used to parse MEI files (None = one per CPU core, 1 = serial)
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', '0')) or None
+# Number of files handed to a worker process at a time
+PARSE_CHUNKSIZE = 16
+# Extract works with the streaming header-only parser instead of the full one (HEADER_ONLY_PARSE=1): it is only
+# faster on files where a large music body follows meiHead, the bundled catalogue is header-only and parses faster in full
+HEADER_ONLY_PARSE = os.environ.get('HEADER_ONLY_PARSE') == '1'
+# Composers to import, with their catalogue source and the crawler's list of their works
+COMPOSERS_FILE = 'composers.json'
+# Version of the extraction logic, bump it when parse results change without an edit of the parsing functions
+# (their source is hashed into parser_version anyway)
+PARSER_VERSION = 1
+
+
+MEI_NS = "http://www.music-encoding.org/ns/mei"
+NS = {"mei": MEI_NS}
+MEI_HEAD_TAG = f"{{{MEI_NS}}}meiHead"
+WORK_LIST_TAG = f"{{{MEI_NS}}}workList"
+TITLE_STMT_TAG = f"{{{MEI_NS}}}titleStmt"
+# Sections of meiHead, handed to the header-only parser (and then cleared) as soon as each one is complete
+MEI_HEAD_SECTION_TAGS = tuple(f"{{{MEI_NS}}}{name}" for name in (
+    'altId', 'fileDesc', 'encodingDesc', 'workDesc', 'workList', 'manifestationList', 'extMeta', 'revisionDesc'
+))
+
+# Precompiled queries used by the header-only parser, evaluated on each section of meiHead
+find_titles = etree.XPath("descendant-or-self::mei:titleStmt/mei:title[1]", namespaces=NS)
+find_terms = etree.XPath("./mei:work/mei:classification/mei:termList/mei:term", namespaces=NS)
+find_creation_dates = etree.XPath("./mei:work/mei:creation/mei:date[1]", namespaces=NS)
 
 
 def parse_mei_xml(xml_path):
     try:
         tree = etree.parse(xml_path)
-    except etree.XMLSyntaxError as e:
+    except (etree.XMLSyntaxError, OSError) as e:
         return None
     root = tree.getroot()
 
-    ns = {"mei": "http://www.music-encoding.org/ns/mei"}
+    title_elems = root.xpath(".//mei:titleStmt/mei:title[1]", namespaces=NS)
+    term_elems = root.xpath("./mei:meiHead/mei:workList/mei:work/mei:classification/mei:termList/mei:term", namespaces=NS)
+    creation_elems = root.xpath("./mei:meiHead/mei:workList/mei:work/mei:creation/mei:date[1]", namespaces=NS)
+    return build_work(
+        [title.text for title in title_elems],
+        [term.text for term in term_elems],
+        [date.attrib for date in creation_elems]
+    )
+
+
+def parse_mei_header(xml_path):
+    """
+    Header-only variant of parse_mei_xml: stream the file with iterparse and stop as soon as meiHead is closed
+    Sections of meiHead are queried as they complete and then cleared, so the music encoding is never read
+    Files that are malformed after meiHead are therefore accepted, where parse_mei_xml would reject them
+    The event loop costs more than it saves on header-only files, it only pays off when a score follows meiHead
+    """
+    titles = []
+    terms = []
+    creation_dates = []
+    head = None
+
+    def consume_sections(last=None):
+        # Query and drop the completed sections of meiHead, in document order, up to and including last
+        nonlocal titles
+        for section in list(head):
+            if not titles:
+                titles = [title.text for title in find_titles(section)]
+            if section.tag == WORK_LIST_TAG:
+                terms.extend(term.text for term in find_terms(section))
+                creation_dates.extend(dict(date.attrib) for date in find_creation_dates(section))
+            head.remove(section)
+            if section is last:
+                break
+
+    try:
+        with open(xml_path, 'rb') as f:
+            tags = (MEI_HEAD_TAG, TITLE_STMT_TAG) + MEI_HEAD_SECTION_TAGS
+            for event, elem in etree.iterparse(f, events=('start', 'end'), tag=tags):
+                if head is None:
+                    if event != 'start':
+                        continue
+                    if elem.tag == MEI_HEAD_TAG and elem.getparent() is not None and elem.getparent().getparent() is None:
+                        head = elem
+                    elif elem.tag == TITLE_STMT_TAG:
+                        # A title before meiHead comes first in document order, let the full parser decide
+                        return parse_mei_xml(xml_path)
+                elif event == 'end' and elem is head:
+                    consume_sections()
+                    break
+                elif event == 'end' and elem.getparent() is head:
+                    consume_sections(elem)
+    except (etree.XMLSyntaxError, OSError) as e:
+        return None
+    if head is None:
+        return None
+    if not titles:
+        # meiHead has no title, parse_mei_xml would look for one in the rest of the document
+        return parse_mei_xml(xml_path)
+    return build_work(titles, terms, creation_dates)
+
 
-    title_elem = root.xpath(".//mei:titleStmt/mei:title[1]", namespaces=ns)
-    if not title_elem or not title_elem[0].text:
+def build_work(titles, terms, creation_dates):
+    """
+    Validate the title texts, genre term texts and creation date attributes found in an MEI header
+    Only the first title and the first creation date are used, as in document order
+    """
+    if not titles or not titles[0]:
         return None
-    work_title = title_elem[0].text.strip()
+    work_title = titles[0].strip()
 
-    term_elems = root.xpath("./mei:meiHead/mei:workList/mei:work/mei:classification/mei:termList/mei:term", namespaces=ns)
-    genres = [t.text.strip() for t in term_elems if t.text and t.text.strip()]
+    genres = [t.strip() for t in terms if t and t.strip()]
     if not genres:
         return None
 
-    creation_elems = root.xpath("./mei:meiHead/mei:workList/mei:work/mei:creation/mei:date[1]", namespaces=ns)
-    if not creation_elems:
+    if not creation_dates:
         return None
-    creation_elem = creation_elems[0]
+    creation_date = creation_dates[0]
 
-    isodate_attr = creation_elem.get("isodate")
-    not_before_attr = creation_elem.get("notbefore")
+    isodate_attr = creation_date.get("isodate")
+    not_before_attr = creation_date.get("notbefore")
     creation_year_str = None
 
     if isodate_attr:
@@ -56,32 +156,154 @@ def parse_mei_xml(xml_path):
     )
 
 
-def data_clean():
-    works = []
-    for composer in ['Carl Nielsen', 'Frederick Delius']:
-        composer_txt_filename = f'{composer}.txt'
+def normalize_xml_path(xml_path: str) -> str:
+    """Convert a path recorded by the crawler (which may use Windows separators) to a local path"""
+    parts = re.split(r'[\\/]+', xml_path)
+    # An absolute path keeps its leading separator
+    if not parts[0]:
+        parts[0] = os.sep
+    return os.path.join(*parts)
+
+
+def compare_parsers(xml_dir: str = 'xml-files'):
+    """Check that parse_mei_header agrees with parse_mei_xml on every XML file under xml_dir, return the paths that differ"""
+    mismatches = []
+    for dirpath, _, filenames in os.walk(xml_dir):
+        for filename in sorted(filenames):
+            if not filename.endswith('.xml'):
+                continue
+            xml_path = os.path.join(dirpath, filename)
+            expected = parse_mei_xml(xml_path)
+            actual = parse_mei_header(xml_path)
+            if (expected and expected.to_dict()) != (actual and actual.to_dict()):
+                mismatches.append(xml_path)
+    return mismatches
+
+
+def parse_work_record(xml_path):
+    """Parse one MEI file into a compact (title, genre, creation_year) tuple, or None if it is rejected"""
+    work = parse_mei_header(xml_path) if HEADER_ONLY_PARSE else parse_mei_xml(xml_path)
+    if not work:
+        return None
+    return work.title, work.genre, work.creation_year
+
+
+def parser_version() -> str:
+    """
+    Version of the parse records: PARSER_VERSION, the parser used, the lxml version and a hash of the source of the
+    parsing functions, so editing the extraction logic invalidates the parse cache
+    """
+    source = ''.join(inspect.getsource(fn) for fn in (parse_mei_xml, parse_mei_header, build_work, parse_work_record))
+    lxml_version = '.'.join(map(str, etree.LXML_VERSION))
+    # The parsers disagree on files that are malformed after meiHead
+    parser = 'header' if HEADER_ONLY_PARSE else 'full'
+    return f'{PARSER_VERSION}-{parser}-{lxml_version}-{hashlib.sha1(source.encode()).hexdigest()[:12]}'
+
+
+def parse_in_workers(xml_paths, workers: int | None = PARSE_WORKERS, chunksize: int = PARSE_CHUNKSIZE):
+    """
+    Parse MEI files into compact records, in the same order as xml_paths
+    Spread the work over a process pool unless workers is 1 (serial mode, useful for debugging)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(xml_paths))
+    if workers <= 1:
+        return [parse_work_record(xml_path) for xml_path in xml_paths]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(parse_work_record, xml_paths, chunksize=chunksize))
+    except (BrokenProcessPool, OSError) as e:
+        print(f'Process pool unavailable ({e}), parsing serially')
+        return [parse_work_record(xml_path) for xml_path in xml_paths]
+
+
+def parse_xml_files(xml_paths, workers: int | None = PARSE_WORKERS, chunksize: int = PARSE_CHUNKSIZE,
+                    cache_file: str | None = PARSE_CACHE_FILE):
+    """
+    Parse MEI files into compact records, in the same order as xml_paths
+    With a cache_file, only files that are new or changed since they were last parsed are parsed (see ParseCache)
+    """
+    if not cache_file:
+        return parse_in_workers(xml_paths, workers, chunksize)
+    with ParseCache(cache_file, parser_version()) as cache:
+        records, stale = cache.lookup(xml_paths)
+        parsed = parse_in_workers([xml_path for xml_path, _, _ in stale], workers, chunksize)
+        cache.store(stale, parsed)
+        cache.prune()
+        print(f"Parse cache: {cache.stats['hits']} files unchanged, {cache.stats['misses']} parsed, "
+              f"{cache.stats['pruned']} entries of deleted files removed")
+    records.update((xml_path, record) for (xml_path, _, _), record in zip(stale, parsed))
+    return [records[xml_path] for xml_path in xml_paths]
+
+
+def load_composers(config_file: str = COMPOSERS_FILE):
+    """Read the composer list: dicts with the composer's name, catalogue_source and manifest (the crawler's .jsonl file)"""
+    with open(config_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_work_entries(composers=None):
+    """
+    Stream the crawl manifests of the composers into (composer, detail page link, xml path) entries
+    A work recorded more than once (e.g. retried by a resumed crawl) keeps its first position and its last record
+    Also return the number of works listed for each composer
+    """
+    entries = []
+    total_counts = {}
+    for composer_config in composers or load_composers():
+        composer = composer_config['name']
+        works_data = {}
         try:
-            with open(composer_txt_filename, 'r', encoding='utf-8') as f:
-                works_data = [eval(line.strip()) for line in f if line.strip()]
+            for work_data in read_manifest(composer_config.get('manifest', f'{composer}{MANIFEST_SUFFIX}')):
+                works_data[work_data.get('Detail Page Link') or len(works_data)] = work_data
         except FileNotFoundError:
             continue
-        total_count = len(works_data)
-        count_after_clean = 0
-        for work_data in works_data:
+        total_counts[composer] = len(works_data)
+        for work_data in works_data.values():
             xml_path = work_data.get('XML Filename')
             detail_url = work_data.get('Detail Page Link')
             if not xml_path:
                 continue
-            work = parse_mei_xml(xml_path)
-            if not work:
-                continue
-            work.composer = composer
-            work.detail_url = detail_url
-            work.decade = f'{work.creation_year // 10}0s'
-            works.append(work)
-            count_after_clean += 1
+            entries.append((composer, detail_url, normalize_xml_path(xml_path)))
+    return entries, total_counts
+
+
+def clean_entries(entries, workers: int | None = PARSE_WORKERS, cache_file: str | None = PARSE_CACHE_FILE):
+    """
+    Parse the XML file of each entry and build a Work for every one that passes validation, keeping entry order
+    Parse results are reused from cache_file where the files did not change, None parses every file
+    """
+    records = parse_xml_files([xml_path for _, _, xml_path in entries], workers=workers, cache_file=cache_file)
+    works = []
+    for (composer, detail_url, xml_path), record in zip(entries, records):
+        if not record:
+            continue
+        title, genre, creation_year = record
+        works.append(Work(
+            work_id=-1,
+            composer_id=-1,
+            title=title,
+            genre=genre,
+            creation_year=creation_year,
+            detail_url=detail_url,
+            composer=composer,
+            decade=f'{creation_year // 10}0s',
+            xml_path=xml_path
+        ))
+    return works
+
+
+def data_clean(workers: int | None = PARSE_WORKERS):
+    entries, total_counts = load_work_entries()
+    works = clean_entries(entries, workers)
+
+    clean_counts = dict.fromkeys(total_counts, 0)
+    for work in works:
+        clean_counts[work.composer] += 1
+    for composer, total_count in total_counts.items():
         print(f'Before clean, Works of {composer}: {total_count}')
-        print(f'After clean, Works of {composer}: {count_after_clean}')
+        print(f'After clean, Works of {composer}: {clean_counts[composer]}')
     genres = set()
     for work in works:
         genres.update(work.genre.split(','))
@@ -1,33 +1,462 @@
+import contextlib
+import hashlib
+import itertools
+import json
 import os
+import queue
+import re
 import sqlite3
-from data_clean import data_clean
-from classes import Work
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from data_clean import load_composers, load_work_entries, clean_entries, PARSE_WORKERS
+from classes import WorkStore
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
 
 DATABASE_FILE = 'database.db'
+# Suffix of the files a new database is built in (database.db.<random>.build); they sit next to DATABASE_FILE, so
+# os.replace swaps them in atomically
+BUILD_SUFFIX = '.build'
+# Suffix of the lock file that makes builds of the same database run one at a time
+LOCK_SUFFIX = '.lock'
+# Seconds between two attempts to take a lock held by another build (Windows only, flock waits by itself)
+LOCK_POLL_INTERVAL = 0.5
+# Attempts to replace the database file and seconds between them; Windows refuses while another process has it open
+REPLACE_ATTEMPTS = 10
+REPLACE_RETRY_DELAY = 0.5
+# Page size of newly built databases, only effective before the first table is created
+PAGE_SIZE = 8192
+# Number of works written per executemany batch during a bulk import
+IMPORT_BATCH_SIZE = 10000
+# Maximum number of pooled read-only connections and how long a request waits for one (seconds)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = 10
+# Pragmas of pooled read-only connections
+READ_PRAGMAS = {
+    'mmap_size': 268435456,
+    'cache_size': -16384,
+    'temp_store': 'MEMORY',
+    'query_only': 'ON',
+}
+# Open pooled connections with immutable=1 (DB_IMMUTABLE=1): SQLite then takes no locks at all, which is safe
+# because the served file is only ever replaced by a rebuild or sync, never written in place
+DB_IMMUTABLE = os.environ.get('DB_IMMUTABLE', '0') == '1'
+# Full-text index tables over work titles and composer names, with their FTS5 tokenizer
+SEARCH_TABLES = {
+    'works_fts': 'trigram',
+    'works_fts_words': 'unicode61 remove_diacritics 2',
+}
 
 
-def init_database():
+def init_database(workers: int | None = PARSE_WORKERS):
     if os.path.exists(DATABASE_FILE):
+        migrate_database()
         return
     print('creating the database...')
+    rebuild_database(workers)
+    print('The database has been created')
+
+
+def migrate_database():
+    """Bring an existing database file up to the current schema, filling new tables from the existing works"""
     conn = sqlite3.connect(DATABASE_FILE)
     cursor = conn.cursor()
     create_table(cursor)
-    import_data(cursor)
+    index_work_genres(cursor)
+    index_work_search(cursor)
+    refresh_composer_stats(cursor)
     conn.commit()
+    # Rebuilds and syncs replace the file instead of writing to it, so it keeps a rollback journal:
+    # the -wal file of a WAL database would be applied to the file that replaces it
+    cursor.execute('PRAGMA journal_mode = DELETE')
     conn.close()
-    print('The database has been created')
+
+
+def read_catalogue_version(database_file: str = DATABASE_FILE) -> int | None:
+    """Catalogue version of a database file, None if there is no (readable) database"""
+    if not os.path.exists(database_file):
+        return None
+    conn = sqlite3.connect(f'file:{urllib.parse.quote(database_file)}?mode=ro', uri=True)
+    try:
+        return get_catalogue_version(conn.cursor())
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def check_database(cursor):
+    """Raise sqlite3.DatabaseError if a newly built database is corrupt, inconsistent or empty"""
+    cursor.execute('PRAGMA integrity_check')
+    problems = [row[0] for row in cursor.fetchall() if row[0] != 'ok']
+    cursor.execute('PRAGMA foreign_key_check')
+    problems += [f'{row[0]} row {row[1]} references a missing {row[2]} row' for row in cursor.fetchall()]
+    cursor.execute('SELECT COUNT(*) FROM works')
+    if cursor.fetchone()[0] == 0:
+        problems.append('the works table is empty')
+    if problems:
+        raise sqlite3.DatabaseError(f"Database check failed: {'; '.join(problems[:10])}")
+
+
+def lock_file(f, blocking: bool) -> bool:
+    """Take an exclusive lock on an open file, return False if blocking is off and another process holds it"""
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def build_lock(database_file: str = DATABASE_FILE):
+    """
+    Hold the lock file of database_file for the duration of a build, waiting for a build already running
+    The lock belongs to the open file, so the OS releases it when a build crashes and the lock file can stay on disk
+    """
+    with open(database_file + LOCK_SUFFIX, 'a+b') as f:
+        if not lock_file(f, blocking=False):
+            print(f'Waiting for another build of {database_file} to finish...')
+            lock_file(f, blocking=True)
+        try:
+            yield
+        finally:
+            unlock_file(f)
+
+
+def create_build_file(database_file: str) -> str:
+    """
+    Create an empty file next to database_file to build its new version in, and return its path
+    Build files left by a crashed build are removed first: the caller holds the build lock, so none is in use
+    """
+    directory, name = os.path.split(os.path.abspath(database_file))
+    for filename in os.listdir(directory):
+        if filename.startswith(name + '.') and filename.endswith(BUILD_SUFFIX):
+            os.remove(os.path.join(directory, filename))
+    fd, build_file = tempfile.mkstemp(suffix=BUILD_SUFFIX, prefix=name + '.', dir=directory)
+    os.close(fd)
+    # mkstemp makes the file private to its owner, the build gets the permissions of the file it replaces instead
+    if os.path.exists(database_file):
+        mode = os.stat(database_file).st_mode
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    os.chmod(build_file, mode)
+    return build_file
+
+
+def replace_database_file(build_file: str, database_file: str):
+    """
+    Swap a finished build in with os.replace
+    Windows refuses to replace a file that another process has open: the replace is retried for a few seconds, then
+    the build is removed and PermissionError raised. A running server keeps its connections open, so on Windows it
+    has to be stopped for a sync or rebuild
+    """
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(build_file, database_file)
+            return
+        except PermissionError as error:
+            if attempt + 1 < REPLACE_ATTEMPTS:
+                time.sleep(REPLACE_RETRY_DELAY)
+                continue
+            os.remove(build_file)
+            raise PermissionError(f'{database_file} cannot be replaced while another process has it open, '
+                                  f'on Windows stop the server before a sync or rebuild') from error
+
+
+def build_database(populate, database_file: str = DATABASE_FILE, copy_current: bool = False, unchanged=None):
+    """
+    Build a new version of database_file in a temporary file and swap it in with os.replace
+    populate(cursor) fills the new file, which starts as a copy of the current database with copy_current and
+    empty otherwise; it is then analyzed, vacuumed and checked, a failed check leaves the current database in place
+    When unchanged(result) is true, populate found nothing to write: the build is dropped and the current file kept
+    Builds of the same file run one at a time (see build_lock), so a build never swaps out the work of another
+    Readers never see a partial build: open connections keep reading the replaced file until they are closed,
+    ConnectionPool reopens its connections on the next acquire. Return the result of populate
+    """
+    with build_lock(database_file):
+        build_file = create_build_file(database_file)
+        conn = sqlite3.connect(build_file)
+        try:
+            if copy_current and os.path.exists(database_file):
+                source = sqlite3.connect(f'file:{urllib.parse.quote(database_file)}?mode=ro', uri=True)
+                source.backup(conn)
+                source.close()
+            cursor = conn.cursor()
+            set_bulk_load_pragmas(cursor)
+            create_table(cursor)
+            result = populate(cursor)
+            conn.commit()
+            keep_current = unchanged is not None and unchanged(result)
+            if not keep_current:
+                # Statistics for the query planner, then a compact file without the free pages left by the load
+                cursor.execute('ANALYZE')
+                conn.commit()
+                cursor.execute('VACUUM')
+                check_database(cursor)
+                cursor.execute('PRAGMA journal_mode = DELETE')
+            conn.close()
+        except BaseException:
+            conn.close()
+            os.remove(build_file)
+            raise
+        if keep_current:
+            os.remove(build_file)
+            return result
+        # The bulk load ran with synchronous = OFF, so make the file durable before it replaces the current one;
+        # Windows only flushes files opened for writing
+        fd = os.open(build_file, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        replace_database_file(build_file, database_file)
+    return result
+
+
+def rebuild_database(workers: int | None = PARSE_WORKERS, database_file: str = DATABASE_FILE):
+    """
+    Build the database from scratch next to the current one and swap it in, the app keeps serving meanwhile
+    The catalogue version continues from the replaced database, so caches and ETags of its data are invalidated
+    """
+
+    def populate(cursor):
+        # Read under the build lock, so a sync finishing meanwhile cannot be missed
+        previous_version = read_catalogue_version(database_file)
+        report = sync_data(cursor, workers)
+        if previous_version is not None:
+            cursor.execute('UPDATE catalogue_version SET generation = ? WHERE id = 1', (previous_version + 1,))
+        return report
+
+    return build_database(populate, database_file)
+
+
+def set_bulk_load_pragmas(cursor):
+    """
+    Tune a connection that builds a new database file in one transaction
+    Durability is not needed while loading: a crash leaves a file that is simply rebuilt
+    """
+    cursor.execute(f'PRAGMA page_size = {PAGE_SIZE}')
+    cursor.execute('PRAGMA journal_mode = OFF')
+    cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('PRAGMA temp_store = MEMORY')
+    cursor.execute('PRAGMA cache_size = -65536')
+
+
+def sync_database(workers: int | None = PARSE_WORKERS):
+    """
+    Bring an existing database in line with the crawled XML files
+    Only files that were added or whose content changed are parsed again, works of removed files are deleted
+    The sync runs on a copy of the database that replaces it when done, so the app never sees a partial sync
+    When nothing changed the copy is dropped, the database file and the connections to it stay as they are
+    """
+    report = build_database(lambda cursor: sync_data(cursor, workers), copy_current=True, unchanged=sync_is_noop)
+    print(f"Sync finished: {len(report['added'])} added, {len(report['changed'])} changed, "
+          f"{len(report['removed'])} removed, {report['unchanged']} unchanged")
+    return report
+
+
+def sync_is_noop(report: dict) -> bool:
+    """True if a sync wrote nothing: no file added, changed, removed or touched and no work without a file removed"""
+    return not (report['added'] or report['changed'] or report['removed'] or report['touched'] or report['orphans'])
+
+
+# Callables applied to every connection opened by get_db_connection (e.g. to install a trace callback)
+connection_hooks = []
 
 
 def get_db_connection():
     conn = sqlite3.connect(DATABASE_FILE)
     conn.row_factory = sqlite3.Row
+    for hook in connection_hooks:
+        hook(conn)
     return conn
 
 
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived read-only connections for the web app
+    Connections are created on demand up to max_size; when all are in use, acquire waits for a release
+    When the database file is replaced (see build_database), connections to the old file are closed as they come
+    back and the next acquire opens the new file, so running workers need no restart
+    """
+
+    def __init__(self, database_file: str = DATABASE_FILE, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 factory=sqlite3.Connection, immutable: bool = DB_IMMUTABLE):
+        self.database_file = database_file
+        self.factory = factory
+        self.immutable = immutable
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waited = 0
+        # Identity of the database file the current connections were opened on, and the file generation of each
+        self._file_id = self._stat_file()
+        self._file_generation = 0
+        self._generations = {}
+
+    def _stat_file(self):
+        try:
+            stat = os.stat(self.database_file)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+    def _check_file(self):
+        """Start a new file generation if the database file was replaced or changed since the last check"""
+        file_id = self._stat_file()
+        with self._lock:
+            if file_id == self._file_id:
+                return
+            self._file_id = file_id
+            self._file_generation += 1
+        self.close_all()
+
+    def open_connection(self):
+        """
+        A new connection configured like the pooled ones, but not managed by the pool: the caller closes it
+        For long reads such as streamed exports, which would otherwise hold a pooled connection for as long as
+        the client takes to download
+        """
+        # A connection is used by one thread at a time, but not always the thread that created it
+        if self.immutable:
+            uri = f'file:{urllib.parse.quote(os.path.abspath(self.database_file))}?mode=ro&immutable=1'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=self.factory)
+        else:
+            conn = sqlite3.connect(self.database_file, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in READ_PRAGMAS.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        for hook in connection_hooks:
+            hook(conn)
+        return conn
+
+    def _connect(self):
+        generation = self._file_generation
+        conn = self.open_connection()
+        self._generations[conn] = generation
+        return conn
+
+    def acquire(self):
+        self._check_file()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                with self._lock:
+                    self._waited += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f'No database connection available after {self.timeout}s')
+        if self._generations.get(conn) != self._file_generation:
+            # Released by a request that was still reading the replaced file
+            self._discard(conn)
+            with self._lock:
+                self._created += 1
+            try:
+                conn = self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        if self._generations.get(conn) != self._file_generation:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        self._generations.pop(conn, None)
+        conn.close()
+        with self._lock:
+            self._created -= 1
+
+    def close_all(self):
+        """Close the idle connections, e.g. after the database file was replaced"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'connections': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'acquired': self._acquired,
+                'waited': self._waited,
+                'file_generation': self._file_generation,
+                'immutable': self.immutable,
+            }
+
+
 def create_table(cursor):
     create_composers_table(cursor)
     create_works_table(cursor)
+    create_genres_tables(cursor)
+    create_search_tables(cursor)
+    create_xml_files_table(cursor)
+    create_catalogue_version_table(cursor)
+    create_composer_stats_table(cursor)
+    create_indexes(cursor)
 
 
 def create_composers_table(cursor):
@@ -50,31 +479,345 @@ def create_works_table(cursor):
             creation_year INTEGER NOT NULL,
             detail_url TEXT NOT NULL,
             decade TEXT NOT NULL,
+            xml_path TEXT,
             FOREIGN KEY (composer_id) 
                 REFERENCES composers (composer_id)
         )
 
     ''')
+    # Databases created before works were linked to their XML files lack the xml_path column
+    cursor.execute('PRAGMA table_info(works)')
+    if 'xml_path' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE works ADD COLUMN xml_path TEXT')
+
+
+def create_genres_tables(cursor):
+    """
+    Genres of each work, one row per (genre, work) pair
+    works.genre keeps the comma-joined names for display, work_genres is what filtering and counting use
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS genres(
+            genre_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS work_genres(
+            genre_id INTEGER NOT NULL,
+            work_id INTEGER NOT NULL,
+            PRIMARY KEY (genre_id, work_id),
+            FOREIGN KEY (genre_id)
+                REFERENCES genres (genre_id),
+            FOREIGN KEY (work_id)
+                REFERENCES works (work_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_work_genres_work_id ON work_genres (work_id)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS works_delete_genres AFTER DELETE ON works
+        BEGIN
+            DELETE FROM work_genres WHERE work_id = old.work_id;
+        END
+    ''')
+
+
+def create_search_tables(cursor):
+    """
+    Full-text indexes over work titles and composer names, keyed by work_id and kept in sync by triggers
+    works_fts uses trigrams for substring search, works_fts_words uses accent-folded words for word search
+    """
+    for table, tokenizer in SEARCH_TABLES.items():
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(title, composer, tokenize="{tokenizer}")
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_works_insert AFTER INSERT ON works
+            BEGIN
+                INSERT INTO {table} (rowid, title, composer)
+                SELECT new.work_id, new.title, name FROM composers WHERE composer_id = new.composer_id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_works_delete AFTER DELETE ON works
+            BEGIN
+                DELETE FROM {table} WHERE rowid = old.work_id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_works_update AFTER UPDATE OF title, composer_id ON works
+            BEGIN
+                DELETE FROM {table} WHERE rowid = old.work_id;
+                INSERT INTO {table} (rowid, title, composer)
+                SELECT new.work_id, new.title, name FROM composers WHERE composer_id = new.composer_id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_composers_update AFTER UPDATE OF name ON composers
+            BEGIN
+                UPDATE {table} SET composer = new.name
+                WHERE rowid IN (SELECT work_id FROM works WHERE composer_id = new.composer_id);
+            END
+        ''')
+
+
+def create_xml_files_table(cursor):
+    """Manifest of every imported XML file, used to detect added, changed and removed files"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS xml_files(
+            xml_path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            content_hash TEXT NOT NULL
+        )
+    ''')
+
+
+def create_composer_stats_table(cursor):
+    """
+    Per-composer aggregates served by the composer endpoints, recomputed by imports for the composers they touch
+    represent_works, genre_stat and year_distribution hold the JSON of the corresponding API fields
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS composer_stats(
+            composer_id INTEGER PRIMARY KEY,
+            work_count INTEGER NOT NULL,
+            represent_works TEXT NOT NULL,
+            genre_stat TEXT NOT NULL,
+            year_distribution TEXT NOT NULL,
+            FOREIGN KEY (composer_id)
+                REFERENCES composers (composer_id)
+        )
+    ''')
+
+
+def create_catalogue_version_table(cursor):
+    """
+    Single-row generation counter, bumped by every import that changes the catalogue
+    It starts from the creation time so that a rebuilt database never reuses the version of the file it replaces
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalogue_version(
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO catalogue_version (id, generation) VALUES (1, ?)', (time.time_ns() // 1000,))
 
 
-def import_data(cursor):
-    works, _ = data_clean()
+def bump_catalogue_version(cursor):
+    cursor.execute('UPDATE catalogue_version SET generation = generation + 1 WHERE id = 1')
+
+
+def get_catalogue_version(cursor) -> int:
+    """Current generation of the catalogue data; it changes whenever an import changes the works"""
+    cursor.execute('SELECT generation FROM catalogue_version WHERE id = 1')
+    return cursor.fetchone()[0]
+
+
+def create_indexes(cursor):
+    """
+    Secondary indexes for the queries in app.py, checked by check_query_plans.py
+    The composer_id indexes cover the composer detail queries (top works, decade counts, genre counts)
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_composers_name ON composers (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_works_composer_year ON works (composer_id, creation_year, title)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_works_composer_decade ON works (composer_id, decade)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_works_decade ON works (decade)')
+    # Sort orders of paginated /api/works requests (work_id, the rowid, is implicitly the last column)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_works_title ON works (title)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_works_year ON works (creation_year)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_works_composer_title ON works (composer_id, title)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_works_xml_path ON works (xml_path)')
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sync_data(cursor, workers: int | None = PARSE_WORKERS):
+    """
+    Compare the crawled XML files with the xml_files manifest and apply the difference to the works table
+    Size and mtime are checked first, the content hash is only computed for files whose stat changed
+    Return the paths that were added, changed and removed, the number of unchanged files and of those only touched
+    (new stat, same content), and the number of works removed because no file of the manifest lists them
+    """
+    entries, _ = load_work_entries()
+    cursor.execute('SELECT xml_path, size, mtime, content_hash FROM xml_files')
+    known_files = {row[0]: row[1:] for row in cursor.fetchall()}
+    # Works without a manifest entry (e.g. imported before the manifest existed) are imported again
+    orphan_filter = 'xml_path IS NULL OR xml_path NOT IN (SELECT xml_path FROM xml_files)'
+    cursor.execute(f'SELECT DISTINCT composer_id FROM works WHERE {orphan_filter}')
+    touched_composers = {row[0] for row in cursor.fetchall()}
+    cursor.execute(f'DELETE FROM works WHERE {orphan_filter}')
+
+    report = {'added': [], 'changed': [], 'removed': [], 'unchanged': 0, 'touched': 0, 'orphans': cursor.rowcount}
+    stale_entries = []
+    fingerprints = []
+    # Paths met so far in this pass, with whether their works are imported again: a file listed under several
+    # detail page links is checked once, its other entries follow that decision
+    seen_paths = {}
+    for entry in entries:
+        xml_path = entry[2]
+        if xml_path in seen_paths:
+            if seen_paths[xml_path]:
+                stale_entries.append(entry)
+            continue
+        seen_paths[xml_path] = False
+        try:
+            stat = os.stat(xml_path)
+        except OSError:
+            continue
+        previous = known_files.pop(xml_path, None)
+        if previous and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+            report['unchanged'] += 1
+            continue
+        content_hash = file_hash(xml_path)
+        if previous and previous[2] == content_hash:
+            # Touched but not modified, only the stat needs updating
+            cursor.execute('UPDATE xml_files SET size = ?, mtime = ? WHERE xml_path = ?',
+                           (stat.st_size, stat.st_mtime_ns, xml_path))
+            report['unchanged'] += 1
+            report['touched'] += 1
+            continue
+        report['changed' if previous else 'added'].append(xml_path)
+        seen_paths[xml_path] = True
+        stale_entries.append(entry)
+        fingerprints.append((xml_path, stat.st_size, stat.st_mtime_ns, content_hash))
+
+    # Whatever is left in the manifest is no longer listed by the crawler or no longer on disk
+    report['removed'] = sorted(known_files)
+    for xml_path in report['removed'] + report['changed']:
+        cursor.execute('SELECT composer_id FROM works WHERE xml_path = ?', (xml_path,))
+        touched_composers.update(row[0] for row in cursor.fetchall())
+        cursor.execute('DELETE FROM works WHERE xml_path = ?', (xml_path,))
+    cursor.executemany('DELETE FROM xml_files WHERE xml_path = ?', [(xml_path,) for xml_path in report['removed']])
+
+    touched_composers.update(import_data(cursor, clean_entries(stale_entries, workers)))
+    refresh_composer_stats(cursor, touched_composers)
+    # Rejected files are recorded too, so they are not parsed again until they change
+    cursor.executemany('''
+        INSERT OR REPLACE INTO xml_files (xml_path, size, mtime, content_hash)
+        VALUES (?, ?, ?, ?)
+    ''', fingerprints)
+    if report['orphans'] or report['added'] or report['changed'] or report['removed']:
+        bump_catalogue_version(cursor)
+    return report
+
+
+def import_data(cursor, works, composers=None) -> set:
+    """
+    Bulk-insert works inside the caller's transaction and return the ids of their composers
+    Composer ids are resolved once from the composer config, works of unlisted composers are skipped
+    """
     if not works:
-        return
+        return set()
+
+    composer_ids = register_composers(cursor, composers or load_composers())
+    rows = (
+        (composer_ids.get(work.composer), work.title, work.genre, work.creation_year,
+         work.detail_url, work.decade, work.xml_path)
+        for work in works
+    )
+    # A work needs every column but xml_path: composer, title, genre, creation year, detail page link and decade
+    rows = (row for row in rows if all(row[:6]))
+    while batch := list(itertools.islice(rows, IMPORT_BATCH_SIZE)):
+        cursor.executemany('''
+            INSERT INTO works (composer_id, title, genre, creation_year, detail_url, decade, xml_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+    index_work_genres(cursor)
+    return {composer_ids[work.composer] for work in works if work.composer in composer_ids}
 
-    composer_ids = {}
-    for composer_name in ['Carl Nielsen', 'Frederick Delius']:
-        cid = insert_composer(composer_name, 'Official Catalogue', cursor)
-        if cid:
-            composer_ids[composer_name] = cid
-            print(cid)
-    for work in works:
-        if 'Carl Nielsen' in work.composer:
-            work.composer_id = composer_ids.get('Carl Nielsen')
-        elif 'Frederick Delius' in work.composer:
-            work.composer_id = composer_ids.get('Frederick Delius')
-        if work.composer_id:
-            insert_work(work, cursor)
+
+def index_work_genres(cursor):
+    """Split the genre string of every work that has no work_genres rows yet into genres and work_genres rows"""
+    cursor.execute('SELECT work_id, genre FROM works WHERE work_id NOT IN (SELECT work_id FROM work_genres)')
+    pairs = [(genre, work_id) for work_id, genres in cursor.fetchall() for genre in genres.split(',')]
+    cursor.executemany('INSERT OR IGNORE INTO genres (name) VALUES (?)', {(genre,) for genre, _ in pairs})
+    cursor.executemany('''
+        INSERT OR IGNORE INTO work_genres (genre_id, work_id)
+        SELECT genre_id, ? FROM genres WHERE name = ?
+    ''', [(work_id, genre) for genre, work_id in pairs])
+
+
+def refresh_composer_stats(cursor, composer_ids=()):
+    """Recompute composer_stats for the given composers and for every composer that has no stats row yet"""
+    cursor.execute('SELECT composer_id FROM composers WHERE composer_id NOT IN (SELECT composer_id FROM composer_stats)')
+    composer_ids = set(composer_ids) | {row[0] for row in cursor.fetchall()}
+    for composer_id in composer_ids:
+        # Top 5 representative works (sorted by creation year)
+        cursor.execute('''
+            SELECT title, creation_year as create_year
+            FROM works
+            WHERE composer_id = ?
+            ORDER BY creation_year ASC
+            LIMIT 5
+        ''', (composer_id,))
+        represent_works = [{'title': title, 'create_year': create_year} for title, create_year in cursor.fetchall()]
+        # Work count of each genre
+        cursor.execute('''
+            SELECT g.name as genre, COUNT(*) as count
+            FROM works w
+            JOIN work_genres wg ON wg.work_id = w.work_id
+            JOIN genres g ON g.genre_id = wg.genre_id
+            WHERE w.composer_id = ?
+            GROUP BY g.name
+        ''', (composer_id,))
+        genre_stat = dict(cursor.fetchall())
+        # Work count of each decade
+        cursor.execute('''
+            SELECT decade, COUNT(*) as count
+            FROM works
+            WHERE composer_id = ?
+            GROUP BY decade
+            ORDER BY decade ASC
+        ''', (composer_id,))
+        year_distribution = dict(cursor.fetchall())
+        cursor.execute('''
+            INSERT OR REPLACE INTO composer_stats
+                (composer_id, work_count, represent_works, genre_stat, year_distribution)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (composer_id, sum(year_distribution.values()), json.dumps(represent_works, ensure_ascii=False),
+              json.dumps(genre_stat, ensure_ascii=False), json.dumps(year_distribution, ensure_ascii=False)))
+
+
+def get_composer_stats(cursor, composer_id: int | None = None) -> list:
+    """
+    Precomputed summaries of one composer (or of all composers, sorted by name) in the composer API format
+    """
+    query = '''
+        SELECT c.composer_id, c.name, s.work_count, s.represent_works, s.genre_stat, s.year_distribution
+        FROM composers c
+        JOIN composer_stats s ON s.composer_id = c.composer_id
+    '''
+    if composer_id is None:
+        cursor.execute(query + ' ORDER BY c.name')
+    else:
+        cursor.execute(query + ' WHERE c.composer_id = ?', (composer_id,))
+    return [{
+        'id': row[0],
+        'name': row[1],
+        'work_count': row[2],
+        'represent_works': json.loads(row[3]),
+        'genre_stat': json.loads(row[4]),
+        'year_distribution': json.loads(row[5]),
+    } for row in cursor.fetchall()]
+
+
+def register_composers(cursor, composers) -> dict:
+    """Insert the configured composers that are not in the database yet, return a name -> composer_id map"""
+    cursor.execute('SELECT name, composer_id FROM composers')
+    composer_ids = dict(cursor.fetchall())
+    for composer in composers:
+        if composer['name'] not in composer_ids:
+            composer_ids[composer['name']] = insert_composer(composer['name'], composer['catalogue_source'], cursor)
+    return composer_ids
 
 
 def insert_composer(name: str, catalogue_source: str, cursor) -> int | None:
@@ -89,16 +832,33 @@ def insert_composer(name: str, catalogue_source: str, cursor) -> int | None:
     return cursor.lastrowid
 
 
-def insert_work(work: Work, cursor):
-    if not all([work.composer_id, work.title, work.genre, work.creation_year, work.detail_url, work.decade]):
-        return None
-    cursor.execute('''
-        INSERT INTO works (composer_id, title, genre, creation_year, detail_url,decade)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (work.composer_id, work.title, work.genre, work.creation_year, work.detail_url, work.decade))
+# JSON object of a work as built by SQLite, keys in the sorted order of jsonify; selected from works w
+# joined with composers c, it is the Work.to_dict of the row
+WORK_JSON_OBJECT = 'json_object(' + ', '.join(f"'{key}', {column}" for key, column in (
+    ('composer', 'c.name'),
+    ('composer_id', 'w.composer_id'),
+    ('creation_year', 'w.creation_year'),
+    ('decade', 'w.decade'),
+    ('detail_url', 'w.detail_url'),
+    ('genre', 'w.genre'),
+    ('title', 'w.title'),
+    ('work_id', 'w.work_id'),
+)) + ')'
+
+
+def json_array_of_rows(cursor, fetch_size: int = WorkStore.FETCH_SIZE) -> bytes:
+    """
+    Join the JSON texts in the only column of an executed cursor's rows (e.g. WORK_JSON_OBJECT) into a JSON array
+    The values never become Python objects of their own, the rows are strings that are joined and encoded once
+    """
+    texts = []
+    while rows := cursor.fetchmany(fetch_size):
+        texts.extend(row[0] for row in rows)
+    return ('[' + ','.join(texts) + ']\n').encode()
 
 
-def get_all_works():
+def get_all_works() -> WorkStore:
+    """Load every work with its composer name into a WorkStore"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -106,24 +866,85 @@ def get_all_works():
             FROM works w
             JOIN composers c ON w.composer_id = c.composer_id
     ''')
-    rows = cursor.fetchall()
+    all_works = WorkStore.from_cursor(cursor)
     conn.close()
-    all_works = []
-    for row in rows:
-        work = Work(
-            work_id=row['work_id'],
-            composer_id=row['composer_id'],
-            title=row['title'],
-            genre=row['genre'],
-            creation_year=row['creation_year'],
-            detail_url=row['detail_url'],
-            composer=row['composer'],
-            decade=row['decade']
-        )
-        all_works.append(work)
     return all_works
 
 
+def index_work_search(cursor):
+    """Rebuild the full-text indexes if they do not cover exactly the works table (e.g. databases created before them)"""
+    cursor.execute('SELECT COUNT(*) FROM works')
+    work_count = cursor.fetchone()[0]
+    for table in SEARCH_TABLES:
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        if cursor.fetchone()[0] == work_count:
+            continue
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(f'''
+            INSERT INTO {table} (rowid, title, composer)
+            SELECT w.work_id, w.title, c.name
+            FROM works w
+            JOIN composers c ON w.composer_id = c.composer_id
+        ''')
+
+
+def keyword_search_query(keyword: str):
+    """
+    Build a subquery returning (work_id, rank) for the works whose title or composer name contains the keyword
+    A work matches if the keyword is a substring (trigram index) or if it contains every word of the keyword
+    (word index, accents ignored); rank is the best bm25 score, lower is better
+    Keywords shorter than a trigram fall back to a LIKE scan with a constant rank
+    Return the SQL text and its parameters
+    """
+    if len(keyword) < 3:
+        return '''
+            SELECT w.work_id, 0 AS rank
+            FROM works w
+            JOIN composers c ON w.composer_id = c.composer_id
+            WHERE w.title LIKE ? OR c.name LIKE ?
+        ''', [f'%{keyword}%', f'%{keyword}%']
+    queries = ['SELECT rowid AS work_id, bm25(works_fts) AS rank FROM works_fts WHERE works_fts MATCH ?']
+    params = [fts_phrase(keyword)]
+    words = re.findall(r'\w+', keyword)
+    if words:
+        queries.append('''
+            SELECT rowid AS work_id, bm25(works_fts_words) AS rank FROM works_fts_words WHERE works_fts_words MATCH ?
+        ''')
+        params.append(' '.join(fts_phrase(word) for word in words))
+    return f'''
+        SELECT work_id, MIN(rank) AS rank
+        FROM ({' UNION ALL '.join(queries)})
+        GROUP BY work_id
+    ''', params
+
+
+def fts_phrase(text: str) -> str:
+    """Quote text as an FTS5 phrase so that operators and punctuation in user input are matched literally"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def get_all_genres(cursor):
+    """Names of all genres that at least one work belongs to, sorted alphabetically"""
+    cursor.execute('''
+        SELECT g.name
+            FROM genres g
+            WHERE EXISTS (SELECT 1 FROM work_genres wg WHERE wg.genre_id = g.genre_id)
+            ORDER BY g.name
+    ''')
+    return [row[0] for row in cursor.fetchall()]
+
+
+def get_all_decades(cursor):
+    """All distinct creation decades of works, sorted"""
+    cursor.execute('SELECT DISTINCT decade FROM works ORDER BY decade')
+    return [row[0] for row in cursor.fetchall()]
+
+
 if __name__ == '__main__':
-    init_database()
+    if len(sys.argv) > 1 and sys.argv[1] == 'sync':
+        sync_database()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'rebuild':
+        rebuild_database()
+    else:
+        init_database()
     get_all_works()
@@ -0,0 +1,109 @@
+from classes import WorkStore
+
+# Facets of /api/search, named after their request parameters
+FACETS = ('type', 'decade', 'composer')
+
+
+def positions_to_bitset(positions, size: int) -> int:
+    """An int with bit p set for every position p, built through a bytearray so it takes linear time"""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bitset_positions(bitset: int, offset: int = 0, limit: int | None = None) -> list:
+    """Positions of the set bits of bitset in ascending order, skipping the first offset of them"""
+    # bin() lists the bits most significant first, reversed its index i is bit i
+    bits = bin(bitset)[:1:-1]
+    positions = []
+    position = bits.find('1')
+    for _ in range(offset):
+        if position < 0:
+            break
+        position = bits.find('1', position + 1)
+    while position >= 0 and (limit is None or len(positions) < limit):
+        positions.append(position)
+        position = bits.find('1', position + 1)
+    return positions
+
+
+class FacetIndex:
+    """
+    In-memory index of the catalogue for faceted search
+    Works are held in a WorkStore sorted by title, every genre, decade and composer has a bitset of the
+    positions of its works (an int), so filtering and counting are ANDs and bit_count() calls
+    """
+
+    def __init__(self, store: WorkStore, version=None):
+        self.store = store
+        self.version = version
+        self.positions = {work_id: position for position, work_id in enumerate(store.work_ids)}
+        self.all_works = (1 << len(store)) - 1
+        facet_values = {
+            'type': (genres.split(',') for genres in store.genres),
+            'decade': ([decade] for decade in store.decades),
+            'composer': ([composer] for composer in store.composers),
+        }
+        self.bitsets = {}
+        for facet in FACETS:
+            postings = {}
+            for position, values in enumerate(facet_values[facet]):
+                for value in values:
+                    postings.setdefault(value, []).append(position)
+            self.bitsets[facet] = {
+                value: positions_to_bitset(postings[value], len(store)) for value in sorted(postings)
+            }
+
+    @classmethod
+    def build(cls, cursor, version=None):
+        """Load every work from the database, in title order"""
+        cursor.execute('''
+            SELECT w.*, c.name as composer
+            FROM works w
+            JOIN composers c ON w.composer_id = c.composer_id
+            ORDER BY w.title, w.work_id
+        ''')
+        return cls(WorkStore.from_cursor(cursor), version)
+
+    def bitset_of_ids(self, work_ids) -> int:
+        """Bitset of the given work ids, e.g. the matches of a keyword search"""
+        return positions_to_bitset(
+            (self.positions[work_id] for work_id in work_ids if work_id in self.positions), len(self.store)
+        )
+
+    def search(self, filters: dict, within: int | None = None, offset: int = 0, limit: int | None = None) -> dict:
+        """
+        Works matching all facets of filters (facet -> selected values, any of which may match)
+        and the number of matches of every facet value under the filters of the other facets
+        within restricts everything to a bitset of works (e.g. keyword matches)
+        """
+        base = self.all_works if within is None else within
+        selected = {}
+        for facet, values in filters.items():
+            if values:
+                facet_bitsets = self.bitsets[facet]
+                selected[facet] = 0
+                for value in values:
+                    selected[facet] |= facet_bitsets.get(value, 0)
+
+        matches = base
+        for bitset in selected.values():
+            matches &= bitset
+        facet_counts = {}
+        for facet in FACETS:
+            # A facet's own selection does not restrict its counts, so the other values stay selectable
+            facet_base = base
+            for other_facet, bitset in selected.items():
+                if other_facet != facet:
+                    facet_base &= bitset
+            facet_counts[facet] = {
+                value: (facet_base & bitset).bit_count() for value, bitset in self.bitsets[facet].items()
+            }
+
+        store = self.store
+        return {
+            'works': [store[position].to_dict() for position in bitset_positions(matches, offset, limit)],
+            'total': matches.bit_count(),
+            'facets': facet_counts,
+        }
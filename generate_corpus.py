@@ -0,0 +1,182 @@
+"""
+Synthetic MEI corpus generator for benchmarks: writes files modelled on the bundled xml-files, together with
+crawl manifests and a composers config that data_clean and database can ingest like the real catalogue
+Usage: python generate_corpus.py <output dir> <number of works> [seed]
+"""
+import copy
+import json
+import os
+import random
+import sys
+
+from lxml import etree
+
+from crawl_manifest import MANIFEST_SUFFIX
+from data_clean import NS
+
+# Real files whose meiHead serves as template, their header structure and size vary a lot
+TEMPLATE_DIR = 'xml-files'
+# Templates loaded at most (chosen evenly over the sorted file list)
+MAX_TEMPLATES = 60
+# Synthetic composers the works are spread over
+COMPOSER_COUNT = 4
+# Works per listing page of the synthetic catalogue, which only shapes the fake detail page links
+WORKS_PER_PAGE = 20
+# Share of files that are broken in one of the ways of MALFORMED_KINDS
+MALFORMED_RATIO = 0.03
+# Ways a file can be broken: the first two are not well-formed XML, the others fail validation in build_work
+MALFORMED_KINDS = ('truncated', 'bad_entity', 'no_title', 'no_genre', 'no_date', 'bad_year')
+# Music body sizes in measures with their probability: most real files are header-only, a few carry a full score
+BODY_MEASURES = ((0, 0.7), (40, 0.2), (500, 0.1))
+# Creation years of valid works
+YEAR_RANGE = (1850, 1935)
+PITCHES = 'cdefgab'
+DURATIONS = ('1', '2', '4', '8')
+
+
+def load_templates(template_dir: str = TEMPLATE_DIR, max_templates: int = MAX_TEMPLATES):
+    """meiHead elements of up to max_templates real files, and the genre terms used across them"""
+    paths = sorted(
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(template_dir) for filename in filenames if filename.endswith('.xml')
+    )
+    step = max(1, len(paths) // max_templates)
+    heads = []
+    genres = set()
+    for path in paths[::step][:max_templates]:
+        try:
+            head = etree.parse(path).getroot().find('mei:meiHead', NS)
+        except etree.XMLSyntaxError:
+            continue
+        if head is None or not head.xpath('./mei:workList/mei:work', namespaces=NS):
+            continue
+        heads.append(head)
+        genres.update(term.text.strip() for term in head.xpath('.//mei:term', namespaces=NS) if term.text)
+    genres = sorted(genre for genre in genres if genre)
+    return heads, genres
+
+
+def title_for(rng, index: int) -> str:
+    words = ('Symphony', 'Sonata', 'Quartet', 'Suite', 'Song', 'Prelude', 'Cantata', 'Rhapsody', 'Serenade')
+    return f"{rng.choice(words)} no. {index} ({rng.choice(('Allegro', 'Andante', 'Adagio', 'Largo'))})"
+
+
+def music_body(rng, measures: int) -> bytes:
+    """An MEI music element with the given number of one-staff measures of random notes"""
+    parts = [b'<music><body><mdiv><score><section>']
+    for n in range(1, measures + 1):
+        notes = ''.join(
+            f'<note pname="{rng.choice(PITCHES)}" oct="{rng.randint(3, 5)}" dur="{rng.choice(DURATIONS)}"/>'
+            for _ in range(rng.randint(2, 8))
+        )
+        parts.append(f'<measure n="{n}"><staff n="1"><layer n="1">{notes}</layer></staff></measure>'.encode())
+    parts.append(b'</section></score></mdiv></body></music>')
+    return b''.join(parts)
+
+
+def synthetic_head(rng, template, genres, index: int, malformed: str | None):
+    """A copy of a template meiHead with a new title, genres and creation date, broken as malformed says"""
+    head = copy.deepcopy(template)
+    titles = head.xpath('.//mei:titleStmt/mei:title', namespaces=NS)
+    for title in titles:
+        title.text = title_for(rng, index)
+    work = head.xpath('./mei:workList/mei:work', namespaces=NS)[0]
+    terms = work.xpath('./mei:classification/mei:termList/mei:term', namespaces=NS)
+    if terms:
+        for term in terms:
+            term.text = rng.choice(genres)
+    else:
+        classification = etree.SubElement(work, f'{{{NS["mei"]}}}classification')
+        term_list = etree.SubElement(classification, f'{{{NS["mei"]}}}termList')
+        etree.SubElement(term_list, f'{{{NS["mei"]}}}term').text = rng.choice(genres)
+    dates = work.xpath('./mei:creation/mei:date', namespaces=NS)
+    if not dates:
+        creation = etree.SubElement(work, f'{{{NS["mei"]}}}creation')
+        dates = [etree.SubElement(creation, f'{{{NS["mei"]}}}date')]
+    year = rng.randint(*YEAR_RANGE)
+    for date in dates:
+        date.attrib.clear()
+        if rng.random() < 0.5:
+            date.set('isodate', f'{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}')
+        else:
+            date.set('notbefore', str(year))
+            date.set('notafter', str(year + rng.randint(0, 3)))
+        date.text = str(year)
+
+    if malformed == 'no_title':
+        for title in titles:
+            title.getparent().remove(title)
+    elif malformed == 'no_genre':
+        for term in work.xpath('./mei:classification/mei:termList/mei:term', namespaces=NS):
+            term.getparent().remove(term)
+    elif malformed == 'no_date':
+        for date in dates:
+            date.getparent().remove(date)
+    elif malformed == 'bad_year':
+        for date in dates:
+            date.attrib.clear()
+            date.set('isodate', rng.choice(('17??', '1650', 'unknown')))
+    return head
+
+
+def synthetic_file(rng, templates, genres, index: int, malformed: str | None = None) -> bytes:
+    head = synthetic_head(rng, rng.choice(templates), genres, index, malformed)
+    measures = rng.choices([m for m, _ in BODY_MEASURES], weights=[p for _, p in BODY_MEASURES])[0]
+    data = b''.join([
+        b'<?xml version="1.0" encoding="UTF-8"?>\n',
+        f'<mei xmlns="{NS["mei"]}" meiversion="4.0.1">'.encode(),
+        etree.tostring(head),
+        music_body(rng, measures),
+        b'</mei>',
+    ])
+    if malformed == 'truncated':
+        data = data[:rng.randint(100, len(data) // 2)]
+    elif malformed == 'bad_entity':
+        # An unterminated entity reference in the title
+        data = data.replace(b'</title>', b' &amp </title>', 1)
+    return data
+
+
+def generate_corpus(output_dir: str, count: int, seed: int = 0, malformed_ratio: float = MALFORMED_RATIO,
+                    composer_count: int = COMPOSER_COUNT) -> list:
+    """
+    Write count synthetic MEI files under output_dir/xml-files/<composer>, one JSONL manifest per composer
+    and output_dir/composers.json; return that composer list (manifest paths are absolute)
+    The same seed always produces the same corpus
+    """
+    rng = random.Random(seed)
+    templates, genres = load_templates()
+    output_dir = os.path.abspath(output_dir)
+    composers = []
+    manifests = []
+    for number in range(1, composer_count + 1):
+        name = f'Synthetic Composer {number}'
+        os.makedirs(os.path.join(output_dir, 'xml-files', name), exist_ok=True)
+        manifest = os.path.join(output_dir, f'{name}{MANIFEST_SUFFIX}')
+        composers.append({'name': name, 'catalogue_source': 'Synthetic', 'manifest': manifest})
+        manifests.append(open(manifest, 'w', encoding='utf-8'))
+    try:
+        for index in range(1, count + 1):
+            composer = composers[index % composer_count]
+            malformed = rng.choice(MALFORMED_KINDS) if rng.random() < malformed_ratio else None
+            xml_path = os.path.join(output_dir, 'xml-files', composer['name'], f'synthetic{index:07d}.xml')
+            with open(xml_path, 'wb') as f:
+                f.write(synthetic_file(rng, templates, genres, index, malformed))
+            work_data = {
+                'Detail Page Link': f'https://example.org/catalogue/document?page={index // WORKS_PER_PAGE}&n={index}',
+                'XML Filename': xml_path,
+            }
+            manifests[index % composer_count].write(json.dumps(work_data, ensure_ascii=False) + '\n')
+    finally:
+        for manifest in manifests:
+            manifest.close()
+    with open(os.path.join(output_dir, 'composers.json'), 'w', encoding='utf-8') as f:
+        json.dump(composers, f, ensure_ascii=False, indent=4)
+    return composers
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
+    generate_corpus(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
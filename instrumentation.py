@@ -0,0 +1,278 @@
+"""
+Lightweight request instrumentation: phase and SQL statement timings of every request, sent back in a
+Server-Timing header and aggregated into latency histograms that /metrics serves in the Prometheus text format
+The histograms live in the memory of each process: under gunicorn every worker keeps and serves its own, so each
+series carries a worker label (the process id) and a scrape sees the worker that happened to answer it
+"""
+import contextlib
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, request
+from json_provider import JSONProvider
+
+# Switch of the whole layer, METRICS_ENABLED=0 turns it off (no timing, no Server-Timing header, no /metrics)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+# Upper bounds (seconds) of the latency histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Phases reported per request besides total: time not spent in any of them is reported as app
+# (routing, object construction, caching)
+PHASES = ('db_acquire', 'sql', 'json', 'compress')
+
+# Timer of the request being handled by the current thread, read by TimedCursor
+current_timer = contextvars.ContextVar('current_timer', default=None)
+
+
+class Histogram:
+    """Thread-safe latency histogram with one series per label combination"""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, seconds: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Bucket counts followed by the +Inf count, then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self, constant_labels: tuple = ()) -> list:
+        """
+        Lines of the Prometheus text format, with cumulative bucket counts
+        constant_labels are (name, value) pairs put before the labels of every series
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            label_pairs = constant_labels + tuple(zip(self.label_names, labels))
+            label_text = ','.join(f'{name}="{escape_label(value)}"' for name, value in label_pairs)
+            prefix = label_text + ',' if label_text else ''
+            count = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), values[:-1]):
+                count += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time from the start of a request until its response is ready.',
+    ('endpoint', 'method', 'status'),
+)
+phase_duration = Histogram(
+    'http_request_phase_duration_seconds', 'Time spent per request in each phase of handling it.',
+    ('endpoint', 'phase'),
+)
+sql_duration = Histogram(
+    'sql_statement_duration_seconds', 'Time spent executing and fetching each SQL statement.',
+    ('statement',),
+)
+
+
+def render_metrics() -> str:
+    """
+    The histograms of this process, labelled with its worker id: the series of two workers are never mixed, so
+    every series only grows (until its worker is replaced) whichever worker answers a scrape
+    """
+    worker = (('worker', str(os.getpid())),)
+    lines = []
+    for histogram in (request_duration, phase_duration, sql_duration):
+        lines += histogram.render(worker)
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    """Drop everything recorded so far, e.g. the warm-up requests of serve.py"""
+    for histogram in (request_duration, phase_duration, sql_duration):
+        histogram.clear()
+
+
+class RequestTimer:
+    """Accumulated phase durations and SQL statement count of one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.statements = 0
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        app_time = total - sum(self.phases.values())
+        entries = [
+            f'sql;dur={self.phases["sql"] * 1000:.2f};desc="{self.statements} statements"'
+            if name == 'sql' else f'{name};dur={self.phases[name] * 1000:.2f}'
+            for name in PHASES
+        ]
+        entries.append(f'app;dur={max(app_time, 0) * 1000:.2f}')
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+@contextlib.contextmanager
+def timed_phase(name: str):
+    """Time a block as the given phase of the current request, a no-op outside instrumented requests"""
+    timer = current_timer.get()
+    if timer is None:
+        yield
+    else:
+        with timer.phase(name):
+            yield
+
+
+def statement_kind(sql: str) -> str:
+    """First keyword of a statement (select, insert, pragma...), a label with few distinct values"""
+    words = sql.split(None, 1)
+    return words[0].lower() if words else 'empty'
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that times its statements: SQLite runs a query up to its first row in execute and steps through
+    the rest in the fetch calls, so both count towards the statement
+    """
+
+    def _timed(self, method, *args):
+        timer = current_timer.get()
+        if timer is None:
+            return method(self, *args)
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            timer.phases['sql'] += elapsed
+            if getattr(self, '_sql_seconds', None) is not None:
+                self._sql_seconds += elapsed
+
+    def _finish_statement(self):
+        """Record the time of the previous statement of this cursor, once it is replaced by a new one"""
+        seconds = getattr(self, '_sql_seconds', None)
+        if seconds is not None:
+            sql_duration.observe((self._sql_kind,), seconds)
+            self._sql_seconds = None
+
+    def _start_statement(self, sql):
+        self._finish_statement()
+        timer = current_timer.get()
+        if timer is not None:
+            timer.statements += 1
+            self._sql_kind = statement_kind(sql)
+            self._sql_seconds = 0.0
+
+    def execute(self, sql, *args):
+        self._start_statement(sql)
+        return self._timed(sqlite3.Cursor.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        self._start_statement(sql)
+        return self._timed(sqlite3.Cursor.executemany, sql, *args)
+
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(sqlite3.Cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+    def close(self):
+        self._finish_statement()
+        return sqlite3.Cursor.close(self)
+
+    def __del__(self):
+        self._finish_statement()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, also those of the conn.execute shortcuts, are TimedCursors"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute creates a plain Cursor without calling cursor(), so the shortcuts are redone here
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+class TimedJSONProvider(JSONProvider):
+    """The app's JSON provider, timing the serialization of jsonify responses as the json phase"""
+
+    def response(self, *args, **kwargs):
+        with timed_phase('json'):
+            return super().response(*args, **kwargs)
+
+
+def start_request_timer():
+    g.request_timer = RequestTimer()
+    g.request_timer_token = current_timer.set(g.request_timer)
+
+
+def finish_request_timer(response):
+    """Add the Server-Timing header and record the request in the histograms"""
+    timer = g.get('request_timer')
+    if timer is None:
+        return response
+    total = time.perf_counter() - timer.start
+    endpoint = request.endpoint or 'unmatched'
+    response.headers['Server-Timing'] = timer.server_timing(total)
+    request_duration.observe((endpoint, request.method, str(response.status_code)), total)
+    for name, seconds in timer.phases.items():
+        phase_duration.observe((endpoint, name), seconds)
+    phase_duration.observe((endpoint, 'app'), max(total - sum(timer.phases.values()), 0))
+    return response
+
+
+def clear_request_timer(exception):
+    """Detach the timer from the thread, also when the request failed before its response was made"""
+    token = g.pop('request_timer_token', None)
+    if token is not None:
+        current_timer.reset(token)
+
+
+def init_app(app):
+    """
+    Instrument every request of app; call it before registering the app's other request hooks, so the timer
+    starts before them and the Server-Timing header is added after them (Flask runs after_request hooks in
+    reverse order of registration)
+    """
+    app.json = TimedJSONProvider(app)
+    app.before_request(start_request_timer)
+    app.after_request(finish_request_timer)
+    app.teardown_request(clear_request_timer)
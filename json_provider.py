@@ -0,0 +1,40 @@
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider encoding with orjson, which is several times faster than the json module
+    Keys are sorted like with Flask's default provider, but text is written as UTF-8 instead of \\u escapes
+    Calls with json module options (indent, cls...) are passed on to the default provider
+    """
+
+    def option(self) -> int:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        if self.compact is False or self.compact is None and self._app.debug:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.option()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Encoded straight to the bytes of the body, without the str round trip of the default provider
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.option() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+# Provider registered by the app: orjson when the optional package is installed
+JSONProvider = OrjsonProvider if orjson else DefaultJSONProvider
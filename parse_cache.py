@@ -0,0 +1,99 @@
+import os
+import sqlite3
+
+# SQLite side file keeping parse results between rebuilds, PARSE_CACHE_FILE= (empty) turns the cache off
+PARSE_CACHE_FILE = os.environ.get('PARSE_CACHE_FILE', 'parse-cache.db')
+
+
+class ParseCache:
+    """
+    On-disk cache of MEI parse records: (title, genre, creation_year), or None for a rejected file
+    Entries are keyed by absolute path and only used while the file's size and mtime are unchanged;
+    all of them are dropped when the parser version (see data_clean.parser_version) differs from the stored one
+    """
+
+    def __init__(self, path: str = PARSE_CACHE_FILE, parser_version: str = ''):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # A lost cache only costs a reparse, so writes need not be durable
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS parse_results (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                title TEXT,
+                genre TEXT,
+                creation_year INTEGER
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cache_info (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        row = self.conn.execute("SELECT value FROM cache_info WHERE key = 'parser_version'").fetchone()
+        if row is None or row[0] != parser_version:
+            self.conn.execute('DELETE FROM parse_results')
+            self.conn.execute("INSERT OR REPLACE INTO cache_info (key, value) VALUES ('parser_version', ?)",
+                              (parser_version,))
+        self.stats = {'hits': 0, 'misses': 0, 'pruned': 0}
+        # Absolute paths of the files lookup found on disk, prune does not need to check them again
+        self.live_paths = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, xml_paths):
+        """
+        Split xml_paths into the records still valid in the cache ({path: record}) and the files to parse,
+        as (path, size, mtime) tuples; size and mtime are None for a file that cannot be read
+        """
+        cached_rows = {
+            row[0]: row[1:] for row in self.conn.execute(
+                'SELECT path, size, mtime, title, genre, creation_year FROM parse_results'
+            )
+        }
+        records = {}
+        stale = {}
+        for xml_path in xml_paths:
+            if xml_path in records or xml_path in stale:
+                continue
+            try:
+                stat = os.stat(xml_path)
+            except OSError:
+                stale[xml_path] = (xml_path, None, None)
+                continue
+            key = os.path.abspath(xml_path)
+            self.live_paths.add(key)
+            row = cached_rows.get(key)
+            if row and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                records[xml_path] = tuple(row[2:]) if row[2] is not None else None
+            else:
+                stale[xml_path] = (xml_path, stat.st_size, stat.st_mtime_ns)
+        self.stats['hits'] += len(records)
+        self.stats['misses'] += len(stale)
+        return records, list(stale.values())
+
+    def store(self, files, records):
+        """Save the records parsed from files, the (path, size, mtime) tuples returned by lookup"""
+        self.conn.executemany('''
+            INSERT OR REPLACE INTO parse_results (path, size, mtime, title, genre, creation_year)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (os.path.abspath(xml_path), size, mtime, *(record or (None, None, None)))
+            for (xml_path, size, mtime), record in zip(files, records) if size is not None
+        ])
+
+    def prune(self) -> int:
+        """Remove the entries of files that no longer exist, return how many were removed"""
+        deleted = [
+            (path,) for path, in self.conn.execute('SELECT path FROM parse_results')
+            if path not in self.live_paths and not os.path.exists(path)
+        ]
+        self.conn.executemany('DELETE FROM parse_results WHERE path = ?', deleted)
+        self.stats['pruned'] += len(deleted)
+        return len(deleted)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Maximum number of cached responses, least recently used ones are evicted first
+CACHE_MAX_ENTRIES = 256
+# Seconds after which a cached response is dropped even if the catalogue did not change
+CACHE_TTL = 300
+# Seconds between two reads of the catalogue version; within that window hits run no SQL at all
+VERSION_CHECK_INTERVAL = 1.0
+
+
+class VersionedCache:
+    """
+    Bounded LRU cache whose entries expire after a TTL or as soon as the catalogue version changes
+    get_version is called at most once per version_check_interval to read the current version
+    """
+
+    def __init__(self, get_version, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL,
+                 version_check_interval: float = VERSION_CHECK_INTERVAL):
+        self.get_version = get_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = float('-inf')
+        self._hits = 0
+        self._misses = 0
+
+    def version(self):
+        """The current catalogue version, read again only once the check interval has passed"""
+        now = time.monotonic()
+        if now - self._version_checked_at >= self.version_check_interval:
+            version = self.get_version()
+            with self._lock:
+                if version != self._version:
+                    self._entries.clear()
+                    self._version = version
+                self._version_checked_at = now
+        return self._version
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing, expired or from an older version"""
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or time.monotonic() - entry[1] > self.ttl:
+                self._entries.pop(key, None)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        version = self.version()
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'version': self._version,
+            }
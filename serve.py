@@ -0,0 +1,156 @@
+"""
+Production server for app.py: gunicorn with pre-forked workers, or waitress (threads in one process) where
+gunicorn is not available, e.g. on Windows
+The app and its catalogue snapshot (database migration, facet and typeahead indexes, warmed response cache) are
+loaded once in the gunicorn master and shared copy-on-write by the forked workers; kill -HUP <master pid> reloads
+the snapshot and replaces the workers gracefully, letting running requests finish
+Usage: python serve.py [--bind HOST:PORT] [--workers N] [--threads N] [--server gunicorn|waitress]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+try:
+    import gunicorn.app.base
+except ImportError:
+    gunicorn = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+# Address to listen on
+SERVE_BIND = os.environ.get('SERVE_BIND', '127.0.0.1:8000')
+# Worker processes (gunicorn only), one per core: SQLite reads and JSON encoding are CPU-bound
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', '0')) or os.cpu_count() or 1
+# Threads per worker, they overlap requests while SQLite and compression release the GIL
+SERVE_THREADS = int(os.environ.get('SERVE_THREADS', '4'))
+# Seconds a worker gets to finish its requests on a reload or shutdown before it is killed
+GRACEFUL_TIMEOUT = 30
+# Requests made before serving, so that the first real requests find warm caches
+WARM_UP_PATHS = (
+    '/',
+    '/composer-detail',
+    '/api/genres',
+    '/api/decades',
+    '/api/composers',
+    '/api/composers/stats',
+    '/api/works',
+    '/api/search',
+    '/api/suggest?q=a',
+)
+
+
+def warm_up(app):
+    """
+    Request WARM_UP_PATHS through a test client, filling the response cache with their plain and compressed bodies
+    The metrics of these requests are dropped, and the database connections they opened are closed, because
+    SQLite connections must not be carried into forked workers
+    """
+    from app import db_pool, CONTENT_ENCODINGS
+    from instrumentation import reset_metrics
+
+    start = time.perf_counter()
+    client = app.test_client()
+    for path in WARM_UP_PATHS:
+        for encoding in [None] + CONTENT_ENCODINGS:
+            response = client.get(path, headers={'Accept-Encoding': encoding} if encoding else {})
+            if response.status_code != 200:
+                print(f'Warm-up request {path} failed with status {response.status_code}')
+                break
+    reset_metrics()
+    db_pool.close_all()
+    print(f'Warmed up {len(WARM_UP_PATHS)} endpoints in {time.perf_counter() - start:.2f}s')
+
+
+def load_snapshot():
+    """Import the app, load the catalogue (creating or migrating the database, building the indexes) and warm it up"""
+    from app import app, load_catalogue
+
+    load_catalogue()
+    warm_up(app)
+    # Move everything loaded so far out of the garbage collector's reach: collections in the workers
+    # would otherwise write to these objects' pages and undo the copy-on-write sharing
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def reload_snapshot():
+    """Load the current catalogue into the already imported app again, before new workers are forked"""
+    from app import app, build_indexes
+
+    gc.unfreeze()
+    build_indexes()
+    warm_up(app)
+    gc.collect()
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Open the worker's own database connection before its first request
+    from app import db_pool
+
+    db_pool.release(db_pool.acquire())
+
+
+if gunicorn:
+    class CatalogueApplication(gunicorn.app.base.BaseApplication):
+        """gunicorn application that preloads the catalogue snapshot in the master process"""
+
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_snapshot()
+
+        def reload(self):
+            # SIGHUP: gunicorn re-reads the config and forks new workers from the master, which first needs the
+            # current catalogue (the old snapshot would only be replaced in each worker on its first request)
+            super().reload()
+            if self.callable is not None:
+                reload_snapshot()
+
+
+def serve_gunicorn(bind: str, workers: int, threads: int):
+    CatalogueApplication({
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'graceful_timeout': GRACEFUL_TIMEOUT,
+        'post_worker_init': post_worker_init,
+    }).run()
+
+
+def serve_waitress(bind: str, threads: int):
+    app = load_snapshot()
+    waitress.serve(app, listen=bind, threads=threads)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the catalogue with a production WSGI server')
+    parser.add_argument('--bind', default=SERVE_BIND, help=f'address to listen on (default: {SERVE_BIND})')
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help='worker processes (gunicorn only)')
+    parser.add_argument('--threads', type=int, default=SERVE_THREADS, help='threads per worker')
+    parser.add_argument('--server', choices=('gunicorn', 'waitress'),
+                        help='WSGI server (default: gunicorn if installed, waitress otherwise)')
+    args = parser.parse_args()
+
+    server = args.server or ('gunicorn' if gunicorn else 'waitress')
+    if server == 'gunicorn' and gunicorn:
+        serve_gunicorn(args.bind, args.workers, args.threads)
+    elif server == 'waitress' and waitress:
+        serve_waitress(args.bind, args.threads)
+    else:
+        print(f'{server} is not installed: pip install {server}')
+        sys.exit(1)
@@ -7,6 +7,21 @@ const resultList = document.getElementById('result-list');
 const resultCount = document.getElementById('result-count');
 const sortSelect = document.getElementById('sort-select');
 const exportCsvBtn = document.getElementById('export-csv-btn');
+const loadMoreBtn = document.getElementById('load-more-btn');
+const keywordSuggestions = document.getElementById('keyword-suggestions');
+
+// Number of works requested per page
+const PAGE_SIZE = 100;
+// Milliseconds without typing before suggestions are requested, and the number of suggestions shown
+const SUGGEST_DELAY = 100;
+const SUGGEST_LIMIT = 10;
+// Server-side sort parameters for each sort menu option
+const SORT_PARAMS = {
+    title_asc: { sort: 'title', order: 'asc' },
+    title_desc: { sort: 'title', order: 'desc' },
+    decade_asc: { sort: 'year', order: 'asc' },
+    decade_desc: { sort: 'year', order: 'desc' }
+};
 
 // Initialize Page
 window.onload = async () => {
@@ -17,15 +32,18 @@ window.onload = async () => {
     keywordInput.addEventListener('keydown', (e) => {
         if (e.key === 'Enter') fetchFilteredWorks();
     });
-    // Add sort menu event
-    sortSelect.addEventListener('change', () => {
-        // Filtered works already exist, sort and re-render directly
-        if (window.filteredWorks) {
-            const sortedWorks = sortWorks(window.filteredWorks);
-            renderResults(sortedWorks);
+    // Suggest titles and composers while typing, picking one runs the search
+    keywordInput.addEventListener('input', (e) => {
+        if (e.inputType === 'insertReplacementText' || !e.inputType) {
+            fetchFilteredWorks();
+        } else {
+            scheduleSuggestions();
         }
     });
+    // Add sort menu event: the server sorts, so fetch the first page again
+    sortSelect.addEventListener('change', fetchFilteredWorks);
     exportCsvBtn.addEventListener('click', exportToCsv);
+    loadMoreBtn.addEventListener('click', fetchNextPage);
     await fetchFilteredWorks();
 
     const composerTags = document.querySelectorAll('.composer-tag');
@@ -89,106 +107,88 @@ async function loadFilterOptions() {
     }
 }
 
+// Show the number of matching works next to each genre and decade option, e.g. "Orchestral music (31)"
+// Each menu counts the works that match the other filters, so every option shows what selecting it would give
+async function updateFacetCounts(params) {
+    try {
+        const searchParams = { keyword: params.keyword, type: params.type, decade: params.decade, limit: 0 };
+        const response = await fetch(`/api/search?${new URLSearchParams(searchParams)}`);
+        if (!response.ok) throw new Error('Request failed');
+
+        const { facets } = await response.json();
+        [[typeSelect, facets.type], [decadeSelect, facets.decade]].forEach(([select, counts]) => {
+            Array.from(select.options).forEach(option => {
+                if (option.value in counts) option.textContent = `${option.value} (${counts[option.value]})`;
+            });
+        });
+    } catch (error) {
+        console.error('Facet count request error: ', error);
+    }
+}
+
+// Request typeahead suggestions for the keyword once the user pauses typing
+let suggestTimer = null;
+let suggestController = null;
+
+function scheduleSuggestions() {
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(loadSuggestions, SUGGEST_DELAY);
+}
+
+async function loadSuggestions() {
+    const query = keywordInput.value.trim();
+    // A newer keystroke makes the pending request obsolete
+    if (suggestController) suggestController.abort();
+    suggestController = new AbortController();
+    if (!query) {
+        keywordSuggestions.innerHTML = '';
+        return;
+    }
+    try {
+        const params = new URLSearchParams({ q: query, limit: SUGGEST_LIMIT });
+        const response = await fetch(`/api/suggest?${params}`, { signal: suggestController.signal });
+        if (!response.ok) throw new Error('Request failed');
+
+        const { suggestions } = await response.json();
+        keywordSuggestions.innerHTML = '';
+        suggestions.forEach(suggestion => {
+            const option = document.createElement('option');
+            option.value = suggestion.text;
+            option.label = suggestion.type === 'composer' ? 'Composer' : 'Work';
+            keywordSuggestions.appendChild(option);
+        });
+    } catch (error) {
+        if (error.name !== 'AbortError') console.error('Suggestion request error: ', error);
+    }
+}
+
 // Export to CSV File
+// The server streams every work matching the current filters and sort order, not only the loaded pages
 function exportToCsv() {
     if (!window.filteredWorks || window.filteredWorks.length === 0) {
         alert('No data to export!');
         return;
     }
 
-    // Get currently sorted work list
-    const sortedWorks = sortWorks(window.filteredWorks);
-
-    // 1. Define CSV headers
-    const headers = [
-        'Work ID',
-        'Composer',
-        'Title',
-        'Genre',
-        'Creation Year',
-        'Detail URL',
-        'Decade'
-    ];
-
-    // 2. Convert work data to CSV rows
-    const csvRows = [
-        headers.join(','), // Header row
-        // Data rows (wrap with double quotes to handle commas and line breaks)
-        ...sortedWorks.map(work => [
-            `"${work.work_id}"`,
-            `"${work.composer}"`,
-            `"${work.title}"`,
-            `"${work.genre}"`,
-            `"${work.creation_year}"`,
-            `"${work.detail_url}"`,
-            `"${work.decade}"`
-        ].join(','))
-    ];
-
-    // 3. Splice CSV content (add BOM to solve Chinese garbled code)
-    // Note: Keep BOM for UTF-8 compatibility even for English
-    const csvContent = '\uFEFF' + csvRows.join('\n');
-
-    // 4. Create Blob and download
-    const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
-    const url = URL.createObjectURL(blob);
+    const { limit, total, ...params } = window.currentParams;
     const link = document.createElement('a');
-    link.setAttribute('href', url);
-    // Custom file name (with timestamp)
-    link.setAttribute('download', `WorkList_${new Date().toLocaleString().replace(/[/: ]/g, '-')}.csv`);
+    link.setAttribute('href', `/api/works/export?${new URLSearchParams({ ...params, format: 'csv' })}`);
     link.style.display = 'none';
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
-    URL.revokeObjectURL(url);
-}
-
-// Sort Work List
-function sortWorks(works) {
-    const sortType = sortSelect.value;
-    let sortedWorks = [...works]; // Copy array to avoid modifying original data
-
-    switch (sortType) {
-        case 'title_asc':
-            // Sort by work title in ascending order (alphabetical)
-            sortedWorks.sort((a, b) => a.title.localeCompare(b.title));
-            break;
-        case 'title_desc':
-            // Sort by work title in descending order
-            sortedWorks.sort((a, b) => b.title.localeCompare(a.title));
-            break;
-        case 'decade_asc':
-            // Sort by creation decade in ascending order
-            sortedWorks.sort((a, b) => {
-                // Extract decade number
-                const decadeA = parseInt(a.decade);
-                const decadeB = parseInt(b.decade);
-                return decadeA - decadeB;
-            });
-            break;
-        case 'decade_desc':
-            // Sort by creation decade in descending order
-            sortedWorks.sort((a, b) => {
-                const decadeA = parseInt(a.decade);
-                const decadeB = parseInt(b.decade);
-                return decadeB - decadeA;
-            });
-            break;
-        default:
-            // Default sort by title in ascending order
-            sortedWorks.sort((a, b) => a.title.localeCompare(b.title));
-    }
-
-    return sortedWorks;
 }
 
-// Request filtered work data from backend
+// Request the first page of filtered work data from backend
 async function fetchFilteredWorks() {
     // Build filter parameters
     const params = {
         keyword: keywordInput.value.trim(),
         type: typeSelect.value,
-        decade: decadeSelect.value
+        decade: decadeSelect.value,
+        ...SORT_PARAMS[sortSelect.value],
+        limit: PAGE_SIZE,
+        total: 1
     };
 
     try {
@@ -196,24 +196,46 @@ async function fetchFilteredWorks() {
         const response = await fetch(`/api/works?${new URLSearchParams(params)}`);
         if (!response.ok) throw new Error('Request failed');
 
-        const data = await response.json();
-        // Save original filtered data (for subsequent sorting)
-        window.filteredWorks = data;
-        // Sort first (default title ascending), then render
-        const sortedWorks = sortWorks(data);
-        renderResults(sortedWorks);
-        exportCsvBtn.disabled = data.length === 0;
+        const page = await response.json();
+        // Save loaded works, the parameters of this list (for export) and of the next page
+        window.filteredWorks = page.works;
+        window.currentParams = params;
+        window.totalWorks = page.total;
+        // Later pages do not need the total again
+        window.nextPageParams = page.next_cursor ? { ...params, total: 0, cursor: page.next_cursor } : null;
+        renderResults(window.filteredWorks);
+        exportCsvBtn.disabled = page.works.length === 0;
+        updateFacetCounts(params);
     } catch (error) {
         console.error('Filter request error: ', error);
         resultList.innerHTML = '<div class="empty-state">Filter failed, please try again</div>';
         resultCount.textContent = 'Total 0 results';
+        loadMoreBtn.style.display = 'none';
+    }
+}
+
+// Request the next page of the current result list and append it
+async function fetchNextPage() {
+    if (!window.nextPageParams) return;
+    try {
+        const response = await fetch(`/api/works?${new URLSearchParams(window.nextPageParams)}`);
+        if (!response.ok) throw new Error('Request failed');
+
+        const page = await response.json();
+        window.filteredWorks = window.filteredWorks.concat(page.works);
+        window.nextPageParams = page.next_cursor ? { ...window.nextPageParams, cursor: page.next_cursor } : null;
+        renderResults(window.filteredWorks);
+    } catch (error) {
+        console.error('Load more request error: ', error);
+        alert('Failed to load more works, please try again');
     }
 }
 
 // Render Result List
 function renderResults(works) {
     // Update result count
-    resultCount.textContent = `Total ${works.length} results`;
+    resultCount.textContent = `Total ${window.totalWorks ?? works.length} results`;
+    loadMoreBtn.style.display = window.nextPageParams ? 'block' : 'none';
 
     if (works.length === 0) {
         resultList.innerHTML = '<div class="empty-state">No matching works</div>';
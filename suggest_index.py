@@ -0,0 +1,66 @@
+import bisect
+import unicodedata
+
+# Letters that Unicode does not decompose into a base letter and an accent, folded by hand
+FOLD_TABLE = str.maketrans({'ø': 'o', 'æ': 'ae', 'œ': 'oe', 'ð': 'd', 'đ': 'd', 'ł': 'l', 'þ': 'th', 'ı': 'i'})
+# Words of a title (from its start) at which a typed prefix may begin, e.g. "no. 4" matches "Symphony no. 4"
+MAX_KEY_WORDS = 8
+
+
+def fold(text: str) -> str:
+    """Normalized key of a text: accents removed, case folded and whitespace collapsed ('Søvnen, Op. 18' -> 'sovnen, op. 18')"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().translate(FOLD_TABLE).split())
+
+
+class SuggestIndex:
+    """
+    Sorted prefix index of work titles and composer names for typeahead
+    Every distinct suggestion has one key per word it may be matched from (its folded text from that word on);
+    the keys are kept in a sorted list, so the keys starting with a prefix are one contiguous run found by bisect
+    Suggestions matching from their first word come before those matching from a later word
+    """
+
+    def __init__(self, titles, composers, version=None):
+        self.version = version
+        self.suggestions = [{'type': 'composer', 'text': name, 'composer_id': composer_id}
+                            for composer_id, name in composers]
+        self.suggestions += [{'type': 'title', 'text': title} for title in sorted(set(titles))]
+        first_word_keys = []
+        later_word_keys = []
+        for position, suggestion in enumerate(self.suggestions):
+            words = fold(suggestion['text']).split(' ')
+            first_word_keys.append((' '.join(words), position))
+            later_word_keys.extend((' '.join(words[i:]), position) for i in range(1, min(len(words), MAX_KEY_WORDS)))
+        # (keys, positions) of both key kinds, in matching priority order
+        self.runs = []
+        for keys in (first_word_keys, later_word_keys):
+            # A composer comes before a title with the same key
+            keys.sort(key=lambda key: (key[0], self.suggestions[key[1]]['type'] != 'composer'))
+            self.runs.append(([key for key, _ in keys], [position for _, position in keys]))
+
+    @classmethod
+    def build(cls, cursor, version=None):
+        """Load the distinct work titles and the composers from the database"""
+        cursor.execute('SELECT DISTINCT title FROM works')
+        titles = [row[0] for row in cursor.fetchall() if row[0]]
+        cursor.execute('SELECT composer_id, name FROM composers ORDER BY name')
+        composers = [(row[0], row[1]) for row in cursor.fetchall()]
+        return cls(titles, composers, version)
+
+    def suggest(self, query: str, limit: int) -> list:
+        """Up to limit suggestions whose text, or one of its words onwards, starts with query (folded)"""
+        prefix = fold(query)
+        if not prefix:
+            return []
+        seen = set()
+        suggestions = []
+        for keys, positions in self.runs:
+            i = bisect.bisect_left(keys, prefix)
+            while i < len(keys) and len(suggestions) < limit and keys[i].startswith(prefix):
+                if positions[i] not in seen:
+                    seen.add(positions[i])
+                    suggestions.append(self.suggestions[positions[i]])
+                i += 1
+        return suggestions
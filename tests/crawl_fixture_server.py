@@ -0,0 +1,138 @@
+"""
+Local stand-in for the composer catalogue sites, serving the minimal listing pages, detail pages and MEI files of
+tests/fixtures/crawl with the URL layout the crawlers expect
+XML downloads carry an ETag and answer a matching If-None-Match with 304, and the requests in FLAKY_REQUESTS fail
+once with 503, so retries and conditional downloads can be tested without the real sites
+Usage: python tests/crawl_fixture_server.py [port], then point a crawler at http://127.0.0.1:<port>/cnw/ or /del/
+"""
+import collections
+import hashlib
+import os
+import sys
+
+from aiohttp import web
+
+# Fixture files, one directory per catalogue
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'crawl')
+# Port of the standalone server
+FIXTURE_PORT = 8765
+# Requests (path and query) answered with 503 the first time they are made
+FLAKY_REQUESTS = {
+    '/cnw/document.xq?n=12',
+    '/del/download_xml.html?doc=delius_seadrift.xml',
+}
+# Listing page served for the pages past the fixtures, the crawlers request a fixed number of pages
+EMPTY_LISTING = '<html><body></body></html>'
+
+# Requests of FLAKY_REQUESTS that already failed, and the number of responses sent by status
+failed_key = web.AppKey('failed', set)
+statuses_key = web.AppKey('statuses', collections.Counter)
+
+
+def fixture_path(catalogue: str, filename: str) -> str:
+    # Only plain file names, never a path out of the fixture directory
+    return os.path.join(FIXTURE_DIR, catalogue, os.path.basename(filename))
+
+
+def html_file(catalogue: str, filename: str):
+    try:
+        with open(fixture_path(catalogue, filename), 'r', encoding='utf-8') as f:
+            return web.Response(text=f.read(), content_type='text/html')
+    except FileNotFoundError:
+        raise web.HTTPNotFound()
+
+
+def listing_page(request, catalogue: str, filename: str):
+    if request.query.get('page') != '1':
+        return web.Response(text=EMPTY_LISTING, content_type='text/html')
+    return html_file(catalogue, filename)
+
+
+def xml_file(request, catalogue: str):
+    """An MEI file with a strong ETag hashed from its content, 304 when the client already has it"""
+    try:
+        with open(fixture_path(catalogue, request.query.get('doc', '')), 'rb') as f:
+            body = f.read()
+    except FileNotFoundError:
+        raise web.HTTPNotFound()
+    etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag})
+    return web.Response(body=body, content_type='application/xml', headers={'ETag': etag})
+
+
+@web.middleware
+async def flaky_requests(request, handler):
+    """Fail the first attempt of each request in FLAKY_REQUESTS, and count the responses by status"""
+    if request.path_qs in FLAKY_REQUESTS and request.path_qs not in request.app[failed_key]:
+        request.app[failed_key].add(request.path_qs)
+        response = web.Response(status=503)
+    else:
+        response = await handler(request)
+    request.app[statuses_key][response.status] += 1
+    return response
+
+
+async def nielsen_listing(request):
+    return listing_page(request, 'cnw', 'index.html')
+
+
+async def nielsen_detail(request):
+    return html_file('cnw', f"document-{request.query.get('n', '')}.html")
+
+
+async def nielsen_xml(request):
+    return xml_file(request, 'cnw')
+
+
+async def delius_listing(request):
+    return listing_page(request, 'delius', 'navigation.html')
+
+
+async def delius_xml(request):
+    return xml_file(request, 'delius')
+
+
+def make_app() -> web.Application:
+    app = web.Application(middlewares=[flaky_requests])
+    app[failed_key] = set()
+    app[statuses_key] = collections.Counter()
+    app.router.add_get('/cnw/index.xq', nielsen_listing)
+    app.router.add_get('/cnw/document.xq', nielsen_detail)
+    app.router.add_get('/cnw/download_xml.xq', nielsen_xml)
+    app.router.add_get('/del/navigation.html', delius_listing)
+    app.router.add_get('/del/download_xml.html', delius_xml)
+    return app
+
+
+class FixtureServer:
+    """The fixture app on a free local port, used as an async context manager inside a test's event loop"""
+
+    def __init__(self):
+        self.app = make_app()
+        self._runner = None
+        self.root_url = None
+
+    async def __aenter__(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.root_url = f'http://127.0.0.1:{port}/'
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+    def url(self, catalogue: str) -> str:
+        """Root URL of a catalogue ('cnw/' or 'del/') to pass to its crawler"""
+        return self.root_url + catalogue
+
+    @property
+    def statuses(self) -> collections.Counter:
+        return self.app[statuses_key]
+
+
+if __name__ == '__main__':
+    web.run_app(make_app(), host='127.0.0.1', port=int(sys.argv[1]) if len(sys.argv) > 1 else FIXTURE_PORT)
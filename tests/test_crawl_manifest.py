@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+
+from crawl_manifest import ManifestWriter, partial_manifest_path, read_manifest
+
+
+def write_manifest(path, links):
+    with open(path, 'w', encoding='utf-8') as f:
+        for link in links:
+            f.write(json.dumps({'Detail Page Link': link}) + '\n')
+
+
+def manifest_links(path):
+    return [work['Detail Page Link'] for work in read_manifest(path)]
+
+
+def test_complete_crawl_replaces_the_manifest(tmp_path):
+    manifest = str(tmp_path / 'composer.jsonl')
+    write_manifest(manifest, ['a', 'b', 'c'])
+    with ManifestWriter(manifest) as writer:
+        writer.write({'Detail Page Link': 'd'})
+        writer.complete = True
+    assert manifest_links(manifest) == ['d']
+    assert not os.path.exists(partial_manifest_path(manifest))
+
+
+def test_incomplete_crawl_keeps_the_works_it_did_not_write(tmp_path):
+    manifest = str(tmp_path / 'composer.jsonl')
+    write_manifest(manifest, ['a', 'b', 'c'])
+    with ManifestWriter(manifest) as writer:
+        writer.write({'Detail Page Link': 'b', 'ETag': 'new'})
+        writer.write({'Detail Page Link': 'd'})
+    assert manifest_links(manifest) == ['b', 'd', 'a', 'c']
+    assert next(read_manifest(manifest))['ETag'] == 'new'
+
+
+def test_interrupted_crawl_keeps_the_manifest_and_resume_continues_it(tmp_path):
+    manifest = str(tmp_path / 'composer.jsonl')
+    write_manifest(manifest, ['a', 'b', 'c'])
+    with pytest.raises(KeyboardInterrupt):
+        with ManifestWriter(manifest) as writer:
+            writer.write({'Detail Page Link': 'a'})
+            raise KeyboardInterrupt
+    assert manifest_links(manifest) == ['a', 'b', 'c']
+    assert manifest_links(partial_manifest_path(manifest)) == ['a']
+
+    # A record cut off by the crash is dropped, the next one still gets a line of its own
+    with open(partial_manifest_path(manifest), 'a', encoding='utf-8') as f:
+        f.write('{"Detail Page')
+    with ManifestWriter(manifest, resume=True) as writer:
+        writer.write({'Detail Page Link': 'b'})
+        writer.complete = True
+    assert manifest_links(manifest) == ['a', 'b']
+
+
+def test_resume_without_partial_manifest_starts_from_the_manifest(tmp_path):
+    manifest = str(tmp_path / 'composer.jsonl')
+    write_manifest(manifest, ['a', 'b'])
+    with ManifestWriter(manifest, resume=True) as writer:
+        writer.write({'Detail Page Link': 'c'})
+    assert manifest_links(manifest) == ['a', 'b', 'c']
@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+from crawl_carl_nielsen_works import crawl_carl_nielsen_works_async
+from crawl_engine import CrawlEngine
+from crawl_fixture_server import FixtureServer, FIXTURE_DIR
+from crawl_frederick_delius_works import crawl_frederick_delius_works_async
+from data_clean import parse_mei_xml
+
+
+def crawl_engine():
+    # No rate limiting against the local server and short backoffs, so the retries only cost milliseconds
+    return CrawlEngine(rate_limit=1000, burst=100, retry_backoff=0.01)
+
+
+async def crawl_both(server, engine, xml_dir, cached_works=None, refresh=False):
+    cached_works = cached_works or {}
+    nielsen = await crawl_carl_nielsen_works_async(engine, os.path.join(xml_dir, 'Carl Nielsen'), server.url('cnw/'),
+                                                   cached_works=cached_works, refresh=refresh)
+    delius = await crawl_frederick_delius_works_async(engine, os.path.join(xml_dir, 'Frederick Delius'),
+                                                      server.url('del/'), cached_works=cached_works, refresh=refresh)
+    return nielsen, delius
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_crawlers_retry_and_download_every_work(tmp_path):
+    async def crawl():
+        async with FixtureServer() as server, crawl_engine() as engine:
+            return await crawl_both(server, engine, str(tmp_path)), engine.stats, server.statuses
+
+    (nielsen, delius), stats, statuses = asyncio.run(crawl())
+
+    assert [work['CNW Number'] for work in nielsen] == ['CNW 7', 'CNW 12']
+    # The listing item without a link is kept, without an XML file
+    assert [work['XML Filename'] is None for work in delius] == [False, False, True]
+    # Both requests that failed once with 503 were retried
+    assert statuses[503] == 2
+    assert stats['retries'] == 2
+    assert stats['failures'] == 0
+    for work, catalogue in [(work, 'cnw') for work in nielsen] + [(work, 'delius') for work in delius[:2]]:
+        fixture = os.path.join(FIXTURE_DIR, catalogue, os.path.basename(work['XML Filename']))
+        assert read_bytes(work['XML Filename']) == read_bytes(fixture)
+        assert work['ETag']
+        assert parse_mei_xml(work['XML Filename']) is not None
+
+
+def test_refresh_downloads_unchanged_files_conditionally(tmp_path):
+    async def crawl():
+        async with FixtureServer() as server:
+            async with crawl_engine() as engine:
+                nielsen, delius = await crawl_both(server, engine, str(tmp_path))
+            cached_works = {work['Detail Page Link']: work for work in nielsen + delius if work['XML Filename']}
+            mtimes = {work['XML Filename']: os.stat(work['XML Filename']).st_mtime_ns for work in cached_works.values()}
+            async with crawl_engine() as engine:
+                refreshed = await crawl_both(server, engine, str(tmp_path), cached_works, refresh=True)
+            return cached_works, mtimes, refreshed, engine
+
+    cached_works, mtimes, (nielsen, delius), engine = asyncio.run(crawl())
+
+    # Every file was revalidated with its ETag and none was written again
+    assert engine.stats['not_modified'] == len(cached_works) == 4
+    assert engine.changed_files == []
+    assert {path: os.stat(path).st_mtime_ns for path in mtimes} == mtimes
+    # The refreshed records keep the validators of the previous ones
+    for work in nielsen + delius[:2]:
+        assert work['ETag'] == cached_works[work['Detail Page Link']]['ETag']
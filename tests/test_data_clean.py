@@ -0,0 +1,10 @@
+import os
+
+from data_clean import compare_parsers
+
+# The bundled catalogue, next to this directory
+XML_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'xml-files')
+
+
+def test_header_parser_agrees_with_full_parser():
+    assert compare_parsers(XML_DIR) == []
@@ -0,0 +1,23 @@
+import os
+import shutil
+
+from check_query_plans import check_query_plans
+
+# The repository, whose bundled catalogue (XML files, manifests, composer config) the database is built from
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATALOGUE_FILES = ('composers.json', 'Carl Nielsen.jsonl', 'Frederick Delius.jsonl')
+
+
+def test_api_queries_use_indexes(tmp_path, monkeypatch):
+    # The app works with paths relative to the working directory: the database is built in tmp_path
+    for filename in CATALOGUE_FILES:
+        shutil.copy(os.path.join(REPO_DIR, filename), tmp_path)
+    try:
+        os.symlink(os.path.join(REPO_DIR, 'xml-files'), tmp_path / 'xml-files', target_is_directory=True)
+    except OSError:
+        # Symbolic links need extra privileges on Windows
+        shutil.copytree(os.path.join(REPO_DIR, 'xml-files'), tmp_path / 'xml-files')
+    monkeypatch.chdir(tmp_path)
+
+    assert check_query_plans() == []
+    assert os.path.exists(tmp_path / 'database.db')